@@ -0,0 +1,69 @@
+""" Cache codec benchmark.
+
+For every installed codec, with and without compression, prints bytes per key and
+microseconds per encode/decode for a single user entry and a page of users. With
+--redis-host it also measures RedisCache.set/get round trips.
+
+    python -m benchmarks.cache_codecs --redis-host localhost
+"""
+import argparse
+import asyncio
+import json
+import time
+import timeit
+
+from internal.pkg.cache import CacheSerializer, RedisCache
+from internal.pkg.cache.codecs import available_codecs
+
+USER = {'v': {'id': 4242, 'username': 'hero_4242', 'email': 'hero_4242@sidus.example'}, 'x': 1.7e9, 'd': 0.0012}
+PAGE = {'v': [dict(USER['v'], id=i, username=f'hero_{i}') for i in range(100)], 'x': 1.7e9, 'd': 0.0042}
+
+
+def micros(fn, number: int) -> float:
+    return round(min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6, 2)
+
+
+async def redis_round_trip(cache: RedisCache, value: dict, number: int) -> dict:
+    await cache.set('bench:codec', value, 60)
+    started = time.perf_counter()
+    for _ in range(number):
+        await cache.set('bench:codec', value, 60)
+    set_us = (time.perf_counter() - started) / number * 1e6
+    started = time.perf_counter()
+    for _ in range(number):
+        await cache.get('bench:codec')
+    get_us = (time.perf_counter() - started) / number * 1e6
+    await cache.remove_key('bench:codec')
+    return {'set_us': round(set_us, 2), 'get_us': round(get_us, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=10_000)
+    parser.add_argument('--redis-host', default=None)
+    parser.add_argument('--redis-port', type=int, default=6379)
+    args = parser.parse_args()
+
+    results = []
+    for codec in available_codecs():
+        for threshold in (None, 256):
+            serializer = CacheSerializer(codec, compress_threshold=threshold)
+            for name, value in (('user', USER), ('page', PAGE)):
+                raw = serializer.dumps(value)
+                result = {
+                    'codec': codec,
+                    'compress_threshold': threshold,
+                    'value': name,
+                    'bytes': len(raw),
+                    'encode_us': micros(lambda: serializer.dumps(value), args.number),
+                    'decode_us': micros(lambda: serializer.loads(raw), args.number),
+                }
+                if args.redis_host:
+                    cache = RedisCache(args.redis_host, args.redis_port, codec=codec, compress_threshold=threshold)
+                    result.update(asyncio.run(redis_round_trip(cache, value, args.number // 10)))
+                results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
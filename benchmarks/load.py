@@ -0,0 +1,308 @@
+""" API load test.
+
+`run` seeds --users accounts, drives a weighted traffic mix with --concurrency closed-loop clients
+for --duration seconds and reports RPS and p50/p95/p99 per route name as JSON:
+
+    python -m benchmarks.load run --target inprocess --scenario mixed         # in-memory repository/cache
+    python -m benchmarks.load run --target gunicorn --workers 4 --scenario read # local Postgres/Redis from env
+    python -m benchmarks.load run --url http://localhost:8000 --scenario auth   # an already running server
+
+`compare` exits with 1 when a route of the second run regressed past the thresholds:
+
+    python -m benchmarks.load compare base.json head.json --latency-threshold 10 --rps-threshold 10
+
+Server targets and --url seed users straight into DB_URL, all seeded users share one password.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from httpx import AsyncClient
+
+from benchmarks.common import InMemoryCache, InMemoryUserRepository, summary
+from internal.app.app import create_app
+from internal.app.settings import GlobalSettings
+from internal.db.database import PostgresDatabase
+from internal.db.repositories.user import UserRepository
+from internal.models.schemas import InUserSchema, UserSchema
+from internal.pkg.auth import AuthJWT
+
+PASSWORD = '12312300'
+
+# Route name -> weight
+SCENARIOS = {
+    'read': {'user:get': 60, 'user:me': 20, 'user:batch': 10, 'user:list': 10},
+    'auth': {'auth:login': 60, 'user:me': 40},
+    'mixed': {
+        'user:get': 45, 'user:me': 20, 'user:batch': 8, 'user:list': 5,
+        'auth:login': 10, 'user:update': 10, 'auth:register': 2,
+    },
+}
+
+ROUTES = create_app()
+
+
+def seed_users(count: int) -> list[InUserSchema]:
+    hashed = AuthJWT.encode_password(PASSWORD)
+    return [
+        InUserSchema.construct(username=f'load_{i}', email=f'load_{i}@sidus.example', password=hashed)
+        for i in range(count)
+    ]
+
+
+async def seed_database(count: int) -> list[UserSchema]:
+    """ Idempotent, existing `load_<i>` users are reused """
+    db = PostgresDatabase(GlobalSettings().ASYNC_DB_URL)
+    try:
+        await db.init_db()
+        repository = UserRepository(db.async_session)
+        users = seed_users(count)
+        for start in range(0, count, 5000):
+            await repository.create_many(users[start:start + 5000])
+        found = await repository.get_many_by('username', [user.username for user in users])
+        return list(found.values())
+    finally:
+        await db.shutdown()
+
+
+@asynccontextmanager
+async def inprocess_target(users: int) -> AsyncIterator[tuple[AsyncClient, list[UserSchema]]]:
+    app = create_app()
+    repository = InMemoryUserRepository()
+    for user in seed_users(users):
+        await repository.create(user)
+    with app.container.user_repository.override(repository), app.container.cache.override(InMemoryCache()):
+        async with AsyncClient(app=app, base_url='http://bench') as client:
+            yield client, list(repository.users.values())
+    app.container.hasher().shutdown()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def server_target(kind: str, workers: int, users: int) -> AsyncIterator[tuple[AsyncClient, list[UserSchema]]]:
+    seeded = await seed_database(users)
+    port = free_port()
+    if kind == 'gunicorn':
+        command = [
+            'gunicorn', '-c', 'python:internal.gunicorn_conf', '-w', str(workers),
+            '-k', 'uvicorn.workers.UvicornWorker', '-b', f'127.0.0.1:{port}', 'internal.main:app',
+        ]
+    else:
+        command = ['uvicorn', 'internal.main:app', '--port', str(port), '--no-access-log']
+    server = subprocess.Popen(command, env={**os.environ, 'WEB_CONCURRENCY': str(workers)})
+    try:
+        async with AsyncClient(base_url=f'http://127.0.0.1:{port}') as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get('/')).status_code == 200:
+                        break
+                except OSError:
+                    pass
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError(f'{kind} did not start')
+                await asyncio.sleep(0.2)
+            yield client, seeded
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+@asynccontextmanager
+async def url_target(url: str, users: int) -> AsyncIterator[tuple[AsyncClient, list[UserSchema]]]:
+    seeded = await seed_database(users)
+    async with AsyncClient(base_url=url) as client:
+        yield client, seeded
+
+
+class VirtualUser:
+    """ Signs in as one seeded user, then picks routes by weight until the deadline """
+
+    def __init__(self, client: AsyncClient, user: UserSchema, ids: list[int], mix: dict[str, int], rnd: random.Random):
+        self.client = client
+        self.user = user
+        self.ids = ids
+        self.routes, self.weights = list(mix), list(mix.values())
+        self.rnd = rnd
+        self.headers = {}
+
+    async def login(self):
+        response = await self.client.post(
+            ROUTES.url_path_for('auth:login'), json={'username': self.user.username, 'password': PASSWORD},
+        )
+        response.raise_for_status()
+        self.headers = {'Authorization': f'Bearer {response.json()["token"]}'}
+        return response
+
+    def request(self, route: str):
+        rnd, path = self.rnd, ROUTES.url_path_for
+        if route == 'auth:login':
+            return self.login()
+        if route == 'auth:register':
+            name = uuid.uuid4().hex[:12]
+            return self.client.post(
+                path(route), json={'username': name, 'email': f'{name}@sidus.example', 'password': PASSWORD},
+            )
+        if route == 'user:get':
+            return self.client.get(path(route, _id=rnd.choice(self.ids)), headers=self.headers)
+        if route == 'user:batch':
+            ids = rnd.sample(self.ids, min(20, len(self.ids)))
+            return self.client.get(path(route), params={'ids': ids}, headers=self.headers)
+        if route == 'user:list':
+            return self.client.get(path(route), params={'limit': 50}, headers=self.headers)
+        if route == 'user:update':
+            email = f'{self.user.username}.{uuid.uuid4().hex[:6]}@sidus.example'
+            return self.client.patch(path(route), json={'email': email}, headers=self.headers)
+        return self.client.get(path(route), headers=self.headers)
+
+    async def run(self, deadline: float, record: bool, samples: dict, errors: dict) -> None:
+        while time.perf_counter() < deadline:
+            route = self.rnd.choices(self.routes, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await self.request(route)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            if record:
+                samples.setdefault(route, []).append(time.perf_counter() - started)
+                errors[route] = errors.get(route, 0) + failed
+
+
+def git_revision() -> str | None:
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True)
+        return revision.stdout.strip() + ('-dirty' if dirty.stdout.strip() else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    if args.url:
+        target = url_target(args.url, args.users)
+    elif args.target == 'inprocess':
+        target = inprocess_target(args.users)
+    else:
+        target = server_target(args.target, args.workers, args.users)
+
+    mix = SCENARIOS[args.scenario]
+    samples, errors = {}, {}
+    async with target as (client, users):
+        ids = [user.id for user in users]
+        clients = [
+            VirtualUser(client, users[i % len(users)], ids, mix, random.Random(args.seed + i))
+            for i in range(args.concurrency)
+        ]
+        await asyncio.gather(*(virtual_user.login() for virtual_user in clients))
+        await asyncio.gather(*(vu.run(time.perf_counter() + args.warmup, False, {}, {}) for vu in clients))
+        started = time.perf_counter()
+        await asyncio.gather(*(vu.run(started + args.duration, True, samples, errors) for vu in clients))
+        elapsed = time.perf_counter() - started
+
+    def stats(route_samples: list[float], route_errors: int) -> dict:
+        return {'rps': round(len(route_samples) / elapsed, 1), 'errors': route_errors, **summary(route_samples)}
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'target': args.url or args.target,
+            'workers': args.workers,
+            'scenario': args.scenario,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'users': args.users,
+            'python': sys.version.split()[0],
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'routes': {route: stats(samples[route], errors[route]) for route in sorted(samples)},
+        'total': stats([sample for route in samples.values() for sample in route], sum(errors.values())),
+    }
+
+
+def compare(base: dict, head: dict, latency_threshold: float, rps_threshold: float, min_delta_ms: float) -> list[str]:
+    """ Human-readable regressions of `head` against `base` """
+    regressions = []
+    routes = {**base['routes'], 'total': base['total']}
+    current = {**head['routes'], 'total': head['total']}
+    for route, before in routes.items():
+        if (after := current.get(route)) is None:
+            continue
+        for metric in ('p95', 'p99'):
+            delta = after[metric] - before[metric]
+            if delta > min_delta_ms and delta > before[metric] * latency_threshold / 100:
+                regressions.append(f'{route} {metric}: {before[metric]}ms -> {after[metric]}ms')
+        if after['rps'] < before['rps'] * (1 - rps_threshold / 100):
+            regressions.append(f'{route} rps: {before["rps"]} -> {after["rps"]}')
+    return regressions
+
+
+def print_comparison(base: dict, head: dict) -> None:
+    print(f'{"route":<16}{"rps":>20}{"p50 ms":>20}{"p95 ms":>20}{"p99 ms":>20}')
+    for route, before in {**base['routes'], 'total': base['total']}.items():
+        after = head['routes'].get(route) if route != 'total' else head['total']
+        if after is None:
+            continue
+        cells = [f'{before[m]} -> {after[m]}' for m in ('rps', 'p50', 'p95', 'p99')]
+        print(f'{route:<16}' + ''.join(f'{cell:>20}' for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--target', choices=['inprocess', 'uvicorn', 'gunicorn'], default='inprocess')
+    run_parser.add_argument('--url', default=None, help='load an already running server instead')
+    run_parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    run_parser.add_argument('--scenario', choices=list(SCENARIOS), default='mixed')
+    run_parser.add_argument('--users', type=int, default=1000)
+    run_parser.add_argument('--concurrency', type=int, default=32)
+    run_parser.add_argument('--duration', type=float, default=30.0)
+    run_parser.add_argument('--warmup', type=float, default=3.0)
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--output', default=None, help='also write the JSON report here')
+
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('head')
+    compare_parser.add_argument('--latency-threshold', type=float, default=10.0, help='max p95/p99 growth, %%')
+    compare_parser.add_argument('--rps-threshold', type=float, default=10.0, help='max RPS drop, %%')
+    compare_parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore latency changes below this')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        result = asyncio.run(run(args))
+        report = json.dumps(result, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(report + '\n')
+        print(report)
+        return
+
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.head, encoding='utf-8') as f:
+        head = json.load(f)
+    print_comparison(base, head)
+    if regressions := compare(base, head, args.latency_threshold, args.rps_threshold, args.min_delta_ms):
+        print('\nRegressions:\n  ' + '\n  '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+""" Login flood benchmark.
+
+Floods `auth:login` with concurrent sign-ins while a single client polls `user:me`,
+and prints p50/p95/p99 for both routes. Runs the app in-process with in-memory
+repository/cache, so only the auth path and the event loop are measured.
+
+    python -m benchmarks.login_flood --executor inline   # bcrypt on the event loop
+    python -m benchmarks.login_flood --executor thread   # bcrypt in the worker pool
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from httpx import AsyncClient
+
+from benchmarks.common import InMemoryCache, InMemoryUserRepository, summary
+from internal.app.app import create_app
+from internal.models.schemas import InUserSchema
+from internal.pkg.auth import AuthJWT, PasswordHasher
+
+PASSWORD = '12312300'
+
+
+async def run(executor: str, workers: int | None, queue: int, concurrency: int, duration: float) -> dict:
+    app = create_app()
+    repository = InMemoryUserRepository()
+    hasher = PasswordHasher(executor=executor, max_workers=workers, max_queue=queue)
+    user = await repository.create(InUserSchema(
+        username='bench', email='bench@example.com', password=PASSWORD,
+    ))
+    user.password = AuthJWT.encode_password(PASSWORD)
+
+    login, me, rejected = [], [], 0
+    deadline = time.perf_counter() + duration
+
+    with app.container.user_repository.override(repository), \
+            app.container.cache.override(InMemoryCache()), \
+            app.container.hasher.override(hasher):
+        async with AsyncClient(app=app, base_url='http://bench') as client:
+            token = (await client.post(
+                app.url_path_for('auth:login'), json={'username': 'bench', 'password': PASSWORD}
+            )).json()['token']
+            headers = {'Authorization': f'Bearer {token}'}
+
+            async def flood():
+                nonlocal rejected
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    response = await client.post(
+                        app.url_path_for('auth:login'), json={'username': 'bench', 'password': PASSWORD}
+                    )
+                    if response.status_code == 503:
+                        rejected += 1
+                        await asyncio.sleep(0.01)
+                    else:
+                        login.append(time.perf_counter() - started)
+
+            async def poll():
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    await client.get(app.url_path_for('user:me'), headers=headers)
+                    me.append(time.perf_counter() - started)
+                    await asyncio.sleep(0.005)
+
+            await asyncio.gather(poll(), *(flood() for _ in range(concurrency)))
+    hasher.shutdown()
+
+    return {
+        'executor': executor,
+        'concurrency': concurrency,
+        'duration_s': duration,
+        'auth:login': summary(login),
+        'auth:login_rejected': rejected,
+        'user:me': summary(me),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--executor', choices=['thread', 'process', 'inline'], default='thread')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--queue', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.executor, args.workers, args.queue, args.concurrency, args.duration))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+""" AuthJWT.decode_token microbenchmark.
+
+Prints microseconds per call for a valid and a garbage token, with and without TokenCache.
+
+    python -m benchmarks.token_decode --number 20000
+"""
+import argparse
+import json
+import timeit
+
+from internal.pkg.auth import AuthJWT, TokenCache
+
+
+def bench(auth: AuthJWT, token: str, number: int) -> float:
+    def call():
+        try:
+            auth.decode_token(token)
+        except Exception:
+            pass
+
+    return round(min(timeit.repeat(call, number=number, repeat=3)) / number * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20_000)
+    args = parser.parse_args()
+
+    token = AuthJWT(secret_key='secret').encode_token(1)
+    garbage = token[:-4] + 'AAAA'
+    uncached = AuthJWT(secret_key='secret')
+    cached = AuthJWT(secret_key='secret', token_cache=TokenCache())
+
+    print(json.dumps({
+        'us_per_call': {
+            'valid': {'uncached': bench(uncached, token, args.number), 'cached': bench(cached, token, args.number)},
+            'garbage': {'uncached': bench(uncached, garbage, args.number), 'cached': bench(cached, garbage, args.number)},
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,8 @@ from fastapi import FastAPI
 from httpx import AsyncClient
 from starlette import status
 
+from internal.models.schemas import InUserSchema
+
 
 @dataclass
 class User:
@@ -116,3 +118,20 @@ async def test_check_protected_api(client: 'AsyncClient', app: 'FastAPI'):
     for method, endpoint in endpoints:
         response = await client.request(method, endpoint)
         assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_create_many_twice(app: 'FastAPI'):
+    repository = app.container.user_repository()
+    users = [
+        InUserSchema.construct(username=f'bulk{i}', email=f'bulk{i}@email.com', password=b'12312300') for i in (1, 2)
+    ]
+
+    # The staging table is dropped on commit, a second import in the same task creates it again
+    created, rejected = await repository.create_many(users[:1])
+    again, duplicates = await repository.create_many(users)
+
+    assert [user.username for user in created] == ['bulk1'] and not rejected
+    assert [user.username for user in again] == ['bulk2'] and duplicates == users[:1]
+    for user in created + again:
+        await repository.delete_by_id(user.id)
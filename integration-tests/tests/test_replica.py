@@ -0,0 +1,44 @@
+import asyncio
+import os
+
+import pytest
+from fastapi import FastAPI
+
+from internal.db.pinning import ReadPin, current_pin
+from internal.models.schemas import InUserSchema
+
+pytestmark = pytest.mark.skipif(
+    not os.getenv('DB_REPLICA_URLS'),
+    reason='needs a replica, see docker-compose.replica.yml',
+)
+
+
+@pytest.mark.asyncio
+async def test_reads_follow_writes_then_move_to_replica(app: 'FastAPI'):
+    db = app.container.db()
+    db.read_your_writes_window = 1.0
+    await db.check_replicas()
+    repository = app.container.user_repository()
+    # What ReadPinMiddleware does for a request
+    current_pin.set(ReadPin())
+
+    user = await repository.create(
+        InUserSchema.construct(username='replica', email='replica@email.com', password=b'12312300')
+    )
+    assert user
+
+    # Read-your-writes: the primary answers right after the write
+    assert db._read_replica() is None
+    assert await repository.get_by_id(user.id) == user
+
+    await asyncio.sleep(db.read_your_writes_window)
+    assert db._read_replica() is not None
+    for _ in range(50):
+        if await repository.get_by_id(user.id) == user:
+            break
+        await asyncio.sleep(0.1)
+    else:
+        pytest.fail('replica never caught up')
+
+    await repository.delete_by_id(user.id)
+    await db.shutdown()
@@ -1,7 +1,8 @@
 from fastapi import APIRouter
 
-from .v1 import auth, users
+from .v1 import admin, auth, users
 
 api_v1_router = APIRouter()
 api_v1_router.include_router(users.router, prefix="/users", tags=["users"])
 api_v1_router.include_router(auth.router, prefix="/auth", tags=["auth"])
+api_v1_router.include_router(admin.router, prefix="/admin", tags=["admin"])
@@ -1 +1,19 @@
-USER_CACHE_KEY = "user_get_{id}"
+from internal.pkg.cache import KeyFamily
+
+# `<etag>\n<OutUserSchema JSON body>`. Families cached per user carry the `users` tag,
+# bump `version` when the format of the value changes
+USER_KEYS = KeyFamily('user', '{id}', version=1, tags=('users',))
+USER_CACHE_TTL = 3600
+# Tombstones of ids without a user
+USER_MISSING_TTL = 30
+USERS_BATCH_LIMIT = 100
+
+USERS_PAGE_LIMIT = 100
+# Pages above this size are streamed as NDJSON
+USERS_STREAM_THRESHOLD = 1000
+USERS_STREAM_MAX_LIMIT = 1_000_000
+
+PRINCIPAL_KEYS = KeyFamily('principal', '{id}', version=2, tags=('users',))
+
+# Every password is hashed inside the request, bigger imports go through `python -m internal.cli.import_users`
+ADMIN_IMPORT_LIMIT = 100
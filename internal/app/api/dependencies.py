@@ -1,42 +1,76 @@
-from typing import TYPE_CHECKING
+import hmac
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import Depends, HTTPException
+from fastapi import Depends, Header, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError
 from starlette import status
 
+from internal.app.api.common import PRINCIPAL_KEYS
 from internal.app.container import Container
+from internal.app.settings import GlobalSettings
 from internal.db.repositories.user import UserRepository
+from internal.models.schemas import PrincipalSchema, UserSchema
 from internal.pkg.auth import AuthJWT
-
-if TYPE_CHECKING:
-    from internal.models.schemas import UserSchema
+from internal.pkg.cache import Cache, CacheKeys
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+def principal_claims(user: UserSchema | PrincipalSchema) -> dict:
+    """ Access token claims `get_current_user` builds the principal from """
+    return {'username': user.username, 'email': user.email, 'ver': user.version}
+
+
 @inject
 async def get_current_user(
         token: str = Depends(oauth2_scheme),
         repository: UserRepository = Depends(Provide[Container.user_repository]),
         auth: AuthJWT = Depends(Provide[Container.auth]),
-) -> 'UserSchema':
+        cache: Cache = Depends(Provide[Container.cache]),
+        keys: CacheKeys = Depends(Provide[Container.cache_keys]),
+        settings: GlobalSettings = Depends(Provide[Container.settings]),
+) -> PrincipalSchema:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        user_id = auth.decode_token(token)
+        claims = auth.decode_claims(token)
+        user_id = claims.get('sub')
         if user_id is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
+    if 'username' in claims and 'email' in claims:
+        # Changes to the user show up in the principal once the client refreshes its token
+        return PrincipalSchema(
+            id=int(user_id), username=claims['username'], email=claims['email'], version=claims.get('ver', 1),
+        )
+
+    # Tokens without claims: the principal comes from the cache or the database
+    cache_key = (await keys.bind(PRINCIPAL_KEYS))(id=user_id)
+    if principal := await cache.get(cache_key):
+        return PrincipalSchema(**principal)
+
     user = await repository.get_by_id(int(user_id))
 
     if user is None:
         raise credentials_exception
 
-    return user
+    principal = PrincipalSchema(**user.dict())
+    await cache.set(cache_key, principal.dict(), settings.PRINCIPAL_CACHE_TTL)
+
+    return principal
+
+
+@inject
+async def get_admin(
+        x_admin_token: str | None = Header(None),
+        settings: GlobalSettings = Depends(Provide[Container.settings]),
+) -> None:
+    if not settings.ADMIN_TOKEN or not x_admin_token \
+            or not hmac.compare_digest(x_admin_token.encode('utf-8'), settings.ADMIN_TOKEN.encode('utf-8')):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
@@ -0,0 +1,20 @@
+from fastapi import Response
+from starlette import status
+
+
+def user_etag(user_id: int, version: int) -> str:
+    """ Strong validator, the user representation changes only together with `version` """
+    return f'"{user_id}.{version}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """ `If-None-Match` uses the weak comparison, so `W/` prefixes are ignored """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
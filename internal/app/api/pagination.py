@@ -0,0 +1,48 @@
+import base64
+import hashlib
+import hmac
+import json
+from typing import Sequence
+
+from fastapi import HTTPException
+from starlette import status
+
+SIGNATURE_SIZE = 16
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def _sign(payload: str, secret: str) -> bytes:
+    return hmac.new(secret.encode('utf-8'), payload.encode('ascii'), hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+
+def encode_cursor(order_by: str, values: Sequence, secret: str) -> str:
+    """ Opaque `<payload>.<signature>`, the signature keeps clients from seeking to crafted keys """
+    payload = _b64encode(json.dumps([order_by, list(values)], separators=(',', ':')).encode('utf-8'))
+    return f'{payload}.{_b64encode(_sign(payload, secret))}'
+
+
+def decode_cursor(cursor: str, order_by: str, types: Sequence[type], secret: str) -> list:
+    """ :param types: python type of every keyset column, in keyset order """
+    invalid = HTTPException(status.HTTP_400_BAD_REQUEST, 'Invalid cursor')
+    payload, _, signature = cursor.partition('.')
+    try:
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload, secret)):
+            raise invalid
+        cursor_order_by, values = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        raise invalid
+    if cursor_order_by != order_by:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Cursor doesn`t match order_by')
+    if not isinstance(values, list) or len(values) != len(types):
+        raise invalid
+    # bool is an int subclass, json true must not seek by id 1
+    if any(type(value) is bool or not isinstance(value, _type) for value, _type in zip(values, types)):
+        raise invalid
+    return values
@@ -0,0 +1,47 @@
+import hashlib
+import math
+
+from fastapi import HTTPException, Request
+from starlette import status
+
+from internal.app.settings import GlobalSettings
+from internal.pkg.metrics import RATE_LIMITED_REQUESTS
+from internal.pkg.ratelimit import Rate, RateLimiter
+
+
+def _username_key(username: str) -> str:
+    # Client-controlled and unbounded, keep Redis keys short
+    return hashlib.blake2b(username.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def client_ip(request: Request) -> str:
+    """ Peer address; behind a proxy run uvicorn/gunicorn with forwarded headers enabled """
+    return request.client.host if request.client else 'unknown'
+
+
+async def _enforce(limiter: RateLimiter, route: str, rules: list[tuple[str, Rate]]) -> None:
+    if retry_after := await limiter.acquire(rules):
+        RATE_LIMITED_REQUESTS.labels(route).inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail='Too many attempts, try again later',
+            headers={'Retry-After': str(math.ceil(retry_after))},
+        )
+
+
+async def limit_sign_in(request: Request, username: str, limiter: RateLimiter, settings: GlobalSettings) -> None:
+    if settings.RATE_LIMIT_ENABLED:
+        await _enforce(limiter, 'auth:login', [
+            (f'sign-in:ip:{client_ip(request)}', Rate(settings.RATE_LIMIT_SIGN_IN_PER_IP, settings.RATE_LIMIT_PERIOD)),
+            (f'sign-in:user:{_username_key(username)}',
+             Rate(settings.RATE_LIMIT_SIGN_IN_PER_USERNAME, settings.RATE_LIMIT_PERIOD)),
+        ])
+
+
+async def limit_sign_up(request: Request, username: str, limiter: RateLimiter, settings: GlobalSettings) -> None:
+    if settings.RATE_LIMIT_ENABLED:
+        await _enforce(limiter, 'auth:register', [
+            (f'sign-up:ip:{client_ip(request)}', Rate(settings.RATE_LIMIT_SIGN_UP_PER_IP, settings.RATE_LIMIT_PERIOD)),
+            (f'sign-up:user:{_username_key(username)}',
+             Rate(settings.RATE_LIMIT_SIGN_UP_PER_USERNAME, settings.RATE_LIMIT_PERIOD)),
+        ])
@@ -1,10 +1,31 @@
 import pydantic
 
+from internal.models.schemas import OutUserSchema, UserSchemaBase
+
 
 class SingInSerializer(pydantic.BaseModel):
     password: str
     username: str
+    # Stable per client device/browser, binds the refresh session to it
+    fingerprint: str | None
+
+
+class RefreshSerializer(pydantic.BaseModel):
+    refresh_token: str
+    fingerprint: str | None
 
 
 class TokenSerializer(pydantic.BaseModel):
     token: str
+    refresh_token: str | None
+    expires_in: int | None
+
+
+class UsersPageSerializer(pydantic.BaseModel):
+    items: list[OutUserSchema]
+    next_cursor: str | None
+
+
+class UsersImportSerializer(pydantic.BaseModel):
+    created: int
+    rejected: list[UserSchemaBase]
@@ -0,0 +1,65 @@
+from dependency_injector.wiring import Provide, inject
+from fastapi import APIRouter, Body, Depends, Query, Response
+from starlette import status
+
+from internal.app.api.common import ADMIN_IMPORT_LIMIT, USER_KEYS
+from internal.app.api.dependencies import get_admin
+from internal.app.api.serializers import UsersImportSerializer
+from internal.app.container import Container
+from internal.db.database import PostgresDatabase
+from internal.db.repositories.user import UserRepository
+from internal.models.schemas import InUserSchema, UserSchemaBase
+from internal.pkg.auth import AuthJWT
+from internal.pkg.cache import Cache, CacheKeys, ExistenceFilter
+
+router = APIRouter(dependencies=[Depends(get_admin)])
+
+
+@router.post(
+    '/users/import',
+    status_code=status.HTTP_200_OK,
+    response_model=UsersImportSerializer,
+    name="admin:users-import",
+)
+@inject
+async def import_users(
+        users: list[InUserSchema] = Body(..., max_items=ADMIN_IMPORT_LIMIT),
+        auth: AuthJWT = Depends(Provide[Container.auth]),
+        repository: UserRepository = Depends(Provide[Container.user_repository]),
+        user_filter: ExistenceFilter = Depends(Provide[Container.user_filter]),
+        cache: Cache = Depends(Provide[Container.cache]),
+        keys: CacheKeys = Depends(Provide[Container.cache_keys]),
+):
+    """ Bulk sign-up, users whose username or email is already taken are reported back """
+    hashed = await auth.encode_passwords_async([user.password for user in users])
+    users = [user.copy(update={'password': password}) for user, password in zip(users, hashed)]
+    created, rejected = await repository.create_many(users)
+    if created:
+        for user in created:
+            user_filter.add(user)
+        user_key = await keys.bind(USER_KEYS)
+        await cache.delete_many([user_key(id=user.id) for user in created])
+    return UsersImportSerializer(
+        created=len(created),
+        rejected=[UserSchemaBase(username=user.username, email=user.email) for user in rejected],
+    )
+
+
+@router.get('/db/pool', status_code=status.HTTP_200_OK, name="admin:db-pool")
+@inject
+async def db_pool(db: PostgresDatabase = Depends(Provide[Container.db])):
+    """ Connection pool of this worker """
+    return db.pool_status()
+
+
+@router.post('/cache/invalidate', status_code=status.HTTP_204_NO_CONTENT, response_class=Response,
+             name="admin:cache-invalidate")
+@inject
+async def invalidate_cache(
+        tags: list[str] = Query(..., min_items=1),
+        keys: CacheKeys = Depends(Provide[Container.cache_keys]),
+):
+    """ Drops every cached entry of the families named or tagged with `tags` (e.g. `users`) in one write.
+    Other services sharing the Redis keep their entries, unlike with FLUSHALL.
+    """
+    await keys.invalidate(*tags)
@@ -1,18 +1,38 @@
 import copy
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response
 from starlette import status
 
-from internal.app.api.serializers import SingInSerializer, TokenSerializer
+from internal.app.api.common import USER_KEYS
+from internal.app.api.dependencies import principal_claims
+from internal.app.api.ratelimit import client_ip, limit_sign_in, limit_sign_up
+from internal.app.api.serializers import (RefreshSerializer, SingInSerializer,
+                                          TokenSerializer)
 from internal.app.container import Container
+from internal.app.settings import GlobalSettings
 from internal.db.repositories.user import UserRepository
 from internal.models.schemas import InUserSchema, OutUserSchema
-from internal.pkg.auth import AuthJWT
+from internal.pkg.auth import AuthJWT, RefreshSessionStore
+from internal.pkg.cache import Cache, CacheKeys, ExistenceFilter
+from internal.pkg.ratelimit import RateLimiter
 
 router = APIRouter()
 
 
+async def is_taken(body: InUserSchema, user_filter: ExistenceFilter, repository: UserRepository) -> bool:
+    """ Duplicate check before paying for bcrypt. Names the filter has never seen skip the lookup,
+    the unique constraints still catch whatever the filter doesn't know about yet.
+    """
+    if not user_filter.ready:
+        return False
+    for column in ('username', 'email'):
+        value = getattr(body, column)
+        if user_filter.might_contain(column, value) and await repository.get(**{column: value}):
+            return True
+    return False
+
+
 @router.post(
     '/sign-up',
     status_code=status.HTTP_201_CREATED,
@@ -21,14 +41,26 @@ router = APIRouter()
 )
 @inject
 async def sign_up(
+        request: Request,
         body: InUserSchema,
         auth: AuthJWT = Depends(Provide[Container.auth]),
         repository: UserRepository = Depends(Provide[Container.user_repository]),
+        user_filter: ExistenceFilter = Depends(Provide[Container.user_filter]),
+        cache: Cache = Depends(Provide[Container.cache]),
+        keys: CacheKeys = Depends(Provide[Container.cache_keys]),
+        limiter: RateLimiter = Depends(Provide[Container.rate_limiter]),
+        settings: GlobalSettings = Depends(Provide[Container.settings]),
 ):
+    await limit_sign_up(request, body.username, limiter, settings)
+    if await is_taken(body, user_filter, repository):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'User with current email or username already exists.')
     data = copy.copy(body)
-    data.password = str(auth.encode_password(data.password))
+    data.password = await auth.encode_password_async(data.password)
     user = await repository.create(data)
     if user:
+        user_filter.add(user)
+        # Somebody may have asked for the next id already
+        await cache.remove_key((await keys.bind(USER_KEYS))(id=user.id))
         return OutUserSchema(**user.dict())
     raise HTTPException(status.HTTP_400_BAD_REQUEST, 'User with current email or username already exists.')
 
@@ -41,17 +73,66 @@ async def sign_up(
 )
 @inject
 async def sign_in(
+        request: Request,
         form_data: SingInSerializer = Body(),
         auth: AuthJWT = Depends(Provide[Container.auth]),
         repository: UserRepository = Depends(Provide[Container.user_repository]),
+        sessions: RefreshSessionStore = Depends(Provide[Container.refresh_sessions]),
+        limiter: RateLimiter = Depends(Provide[Container.rate_limiter]),
+        settings: GlobalSettings = Depends(Provide[Container.settings]),
 ):
-    """Я не стал париться над реализацией refresh токенов,
-    и хранения их refreshSessions(id,user_id,refresh_token,fingerprint,ip, etc) в Redis.
-    Т.к это рутина. info: https://gist.github.com/zmts/802dc9c3510d79fd40f9dc38a12bccfc
+    """ Short-lived access token carrying the user's claims, plus a single-use refresh token
+    bound to `fingerprint`. Exchange the refresh token at `auth:refresh` for a new pair.
     """
+    await limit_sign_in(request, form_data.username, limiter, settings)
     user = await repository.get(username=form_data.username)
     if not user:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, 'User with current username doesn`t exists.')
-    if auth.verify_password(form_data.password, user.password):
-        return TokenSerializer(token=auth.encode_token(user.id))
-    raise HTTPException(status.HTTP_400_BAD_REQUEST, 'The passwords didn`t match')
+    if not await auth.verify_password_async(form_data.password, user.password):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'The passwords didn`t match')
+    if auth.needs_rehash(user.password):
+        # BCRYPT_ROUNDS changed since the hash was made, the plain password is only known here
+        await repository.update_password(user.id, await auth.encode_password_async(form_data.password))
+    return TokenSerializer(
+        token=auth.encode_token(user.id, principal_claims(user)),
+        refresh_token=await sessions.create(user.id, form_data.fingerprint, client_ip(request)),
+        expires_in=settings.ACCESS_TOKEN_TTL,
+    )
+
+
+@router.post(
+    '/refresh',
+    status_code=status.HTTP_200_OK,
+    response_model=TokenSerializer,
+    name="auth:refresh",
+)
+@inject
+async def refresh(
+        request: Request,
+        body: RefreshSerializer,
+        auth: AuthJWT = Depends(Provide[Container.auth]),
+        repository: UserRepository = Depends(Provide[Container.user_repository]),
+        sessions: RefreshSessionStore = Depends(Provide[Container.refresh_sessions]),
+        settings: GlobalSettings = Depends(Provide[Container.settings]),
+):
+    """ Rotates the refresh token, the new access token carries the user's current claims """
+    user_id, refresh_token = await sessions.rotate(body.refresh_token, body.fingerprint, client_ip(request))
+    user = await repository.get_by_id(user_id)
+    if user is None:
+        await sessions.revoke(refresh_token)
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, 'User doesn`t exists')
+    return TokenSerializer(
+        token=auth.encode_token(user.id, principal_claims(user)),
+        refresh_token=refresh_token,
+        expires_in=settings.ACCESS_TOKEN_TTL,
+    )
+
+
+@router.post('/sign-out', status_code=status.HTTP_204_NO_CONTENT, response_class=Response, name="auth:logout")
+@inject
+async def sign_out(
+        body: RefreshSerializer,
+        sessions: RefreshSessionStore = Depends(Provide[Container.refresh_sessions]),
+):
+    """ Ends the refresh session, the access token stays valid until it expires """
+    await sessions.revoke(body.refresh_token)
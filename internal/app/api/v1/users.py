@@ -1,20 +1,120 @@
+from typing import AsyncIterator, Literal
+
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from starlette import status
+from starlette.responses import StreamingResponse
 
-from internal.app.api.common import USER_CACHE_KEY
+from internal.app.api.common import (PRINCIPAL_KEYS, USER_CACHE_TTL,
+                                     USER_KEYS, USER_MISSING_TTL,
+                                     USERS_BATCH_LIMIT, USERS_PAGE_LIMIT,
+                                     USERS_STREAM_MAX_LIMIT,
+                                     USERS_STREAM_THRESHOLD)
 from internal.app.api.dependencies import get_current_user
+from internal.app.api.etag import etag_matches, not_modified, user_etag
+from internal.app.api.pagination import decode_cursor, encode_cursor
+from internal.app.api.serializers import UsersPageSerializer
 from internal.app.container import Container
+from internal.app.settings import GlobalSettings
 from internal.db.repositories.user import UserRepository
-from internal.models.schemas import OutUserSchema, UserSchema, UserSchemaUpdate
+from internal.models.schemas import (OutUserSchema, PrincipalSchema, UserSchema,
+                                     UserSchemaUpdate)
+from internal.pkg.auth import RefreshSessionStore
+from internal.pkg.cache import CacheKeys, CacheLoader, ExistenceFilter
 
 router = APIRouter(tags=['users'])
 
 
+def encode_user(user: UserSchema) -> bytes:
+    """ Cache entry: the ETag line, then the body, so the ETag is read without decoding the body """
+    body = OutUserSchema(**user.dict()).json().encode('utf-8')
+    return user_etag(user.id, user.version).encode('ascii') + b'\n' + body
+
+
+def split_user(cached: bytes) -> tuple[str, bytes]:
+    etag, _, body = cached.partition(b'\n')
+    return etag.decode('ascii'), body
+
+
+async def cached_user(_id: int, loader: CacheLoader, keys: CacheKeys, repository: UserRepository) -> bytes | None:
+    """ `encode_user` of the user through the cache, unknown ids are remembered for USER_MISSING_TTL """
+    async def load_user() -> bytes | None:
+        if user := await repository.get_by_id(_id):
+            return encode_user(user)
+
+    return await loader.get_or_load((await keys.bind(USER_KEYS))(id=_id), load_user, USER_CACHE_TTL, USER_MISSING_TTL)
+
+
+def user_response(cached: bytes, if_none_match: str | None) -> Response:
+    etag, body = split_user(cached)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return Response(body, media_type='application/json', headers={'ETag': etag})
+
+
+async def cached_user_keys(keys: CacheKeys, _id: int) -> list[str]:
+    """ Every entry cached for one user """
+    return [(await keys.bind(family))(id=_id) for family in (USER_KEYS, PRINCIPAL_KEYS)]
+
+
+@router.get(
+    '',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_current_user)],
+    response_model=UsersPageSerializer,
+    name="user:list"
+)
+@inject
+async def list_users(
+        cursor: str | None = None,
+        limit: int = Query(USERS_PAGE_LIMIT, ge=1, le=USERS_STREAM_MAX_LIMIT),
+        order_by: Literal['id', 'username', 'email'] = 'id',
+        repository: UserRepository = Depends(Provide[Container.user_repository]),
+        settings: GlobalSettings = Depends(Provide[Container.settings]),
+):
+    """ Keyset-paginated users. Pass `next_cursor` back as `cursor` to get the next page.
+
+    Pages larger than USERS_STREAM_THRESHOLD are streamed as NDJSON: one user per line,
+    followed by a `{"next_cursor": ...}` line when there may be more users.
+    """
+    keyset = repository.keyset(order_by)
+    types = [UserSchema.__fields__[name].outer_type_ for name in keyset]
+    after = decode_cursor(cursor, order_by, types, settings.SECRET_KEY) if cursor else None
+
+    def next_cursor(last: UserSchema) -> str:
+        return encode_cursor(order_by, [getattr(last, name) for name in keyset], settings.SECRET_KEY)
+
+    if limit <= USERS_STREAM_THRESHOLD:
+        users = await repository.list_after(after, limit, order_by)
+        return UsersPageSerializer(
+            items=[OutUserSchema(**user.dict()) for user in users],
+            next_cursor=next_cursor(users[-1]) if len(users) == limit else None,
+        )
+
+    async def stream() -> AsyncIterator[bytes]:
+        count, last = 0, None
+        async for last in repository.stream_after(after, limit, order_by):
+            count += 1
+            yield OutUserSchema(**last.dict()).json().encode('utf-8') + b'\n'
+        if count == limit:
+            yield UsersPageSerializer(items=[], next_cursor=next_cursor(last)).json(include={'next_cursor'}).encode('utf-8') + b'\n'
+
+    return StreamingResponse(stream(), media_type='application/x-ndjson')
+
+
 @router.get('/me', status_code=status.HTTP_200_OK, response_model=OutUserSchema, name='user:me')
 @inject
-async def me(user: UserSchema = Depends(get_current_user)):
-    return user
+async def me(
+        if_none_match: str | None = Header(None),
+        user: PrincipalSchema = Depends(get_current_user),
+        loader: CacheLoader = Depends(Provide[Container.cache_loader]),
+        keys: CacheKeys = Depends(Provide[Container.cache_keys]),
+        repository: UserRepository = Depends(Provide[Container.user_repository]),
+):
+    """ Read through the user cache: the token claims keep the values from sign-in until the token is refreshed """
+    if cached := await cached_user(user.id, loader, keys, repository):
+        return user_response(cached, if_none_match)
+    raise HTTPException(status.HTTP_401_UNAUTHORIZED, 'User doesn`t exists')
 
 
 @router.get(
@@ -27,35 +127,63 @@ async def me(user: UserSchema = Depends(get_current_user)):
 @inject
 async def get_user(
         _id: int,
-        cache=Depends(Provide[Container.cache]),
+        if_none_match: str | None = Header(None),
+        loader: CacheLoader = Depends(Provide[Container.cache_loader]),
+        keys: CacheKeys = Depends(Provide[Container.cache_keys]),
         repository: UserRepository = Depends(Provide[Container.user_repository]),
 ):
-    cache_key = USER_CACHE_KEY.format(id=_id)
-    if cache_user := await cache.get(cache_key):
-        return cache_user
+    """ Cached as the final JSON body: a hit is returned without decoding, validation or re-encoding.
+
+    `If-None-Match` is answered from the cached ETag alone.
+    """
+    if cached := await cached_user(_id, loader, keys, repository):
+        return user_response(cached, if_none_match)
+    raise HTTPException(status.HTTP_400_BAD_REQUEST, 'User doesn`t exists')
 
-    user = await repository.get_by_id(_id)
 
-    if not user:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'User doesn`t exists')
+@router.get(
+    '/batch',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_current_user)],
+    response_model=list[OutUserSchema],
+    name="user:batch"
+)
+@inject
+async def get_users(
+        ids: list[int] = Query(..., max_items=USERS_BATCH_LIMIT),
+        loader: CacheLoader = Depends(Provide[Container.cache_loader]),
+        keys: CacheKeys = Depends(Provide[Container.cache_keys]),
+        repository: UserRepository = Depends(Provide[Container.user_repository]),
+):
+    """ Users in the order of `ids`, unknown ids are skipped """
+    user_key = await keys.bind(USER_KEYS)
+    ids_by_key = {user_key(id=_id): _id for _id in ids}
 
-    res = OutUserSchema(**user.dict())
-    await cache.set(cache_key, res.dict(), 3600)
+    async def load_users(missing: list[str]) -> dict[str, bytes]:
+        users = await repository.get_many([ids_by_key[key] for key in missing])
+        return {user_key(id=user.id): encode_user(user) for user in users}
 
-    return res
+    bodies = await loader.get_many_or_load(list(ids_by_key), load_users, USER_CACHE_TTL, USER_MISSING_TTL)
+    requested = (user_key(id=_id) for _id in ids)
+    body = b'[' + b','.join(split_user(bodies[key])[1] for key in requested if key in bodies) + b']'
+    return Response(body, media_type='application/json')
 
 
 @router.patch('/me', status_code=status.HTTP_200_OK, response_model=OutUserSchema, name='user:update')
 @inject
 async def update_user(
+        response: Response,
         user_update: UserSchemaUpdate,
-        user: UserSchema = Depends(get_current_user),
+        user: PrincipalSchema = Depends(get_current_user),
         cache=Depends(Provide[Container.cache]),
-        repository: UserRepository = Depends(Provide[Container.user_repository])
+        keys: CacheKeys = Depends(Provide[Container.cache_keys]),
+        repository: UserRepository = Depends(Provide[Container.user_repository]),
+        user_filter: ExistenceFilter = Depends(Provide[Container.user_filter]),
 ):
     if res := await repository.update_by_id(_id=user.id, **user_update.dict(exclude_unset=True)):
-        cache_key = USER_CACHE_KEY.format(id=user.id)
-        await cache.remove_key(cache_key)
+        await cache.delete_many(await cached_user_keys(keys, user.id))
+        user_filter.add(res)
+        response.headers['ETag'] = user_etag(res.id, res.version)
         return res
     raise HTTPException(status.HTTP_400_BAD_REQUEST, 'User doesn`t exists')
 
@@ -63,8 +191,13 @@ async def update_user(
 @router.delete('/me', status_code=status.HTTP_204_NO_CONTENT, response_class=Response, name='user:delete')
 @inject
 async def delete_user(
-        user: UserSchema = Depends(get_current_user),
-        repository: UserRepository = Depends(Provide[Container.user_repository])
+        user: PrincipalSchema = Depends(get_current_user),
+        cache=Depends(Provide[Container.cache]),
+        keys: CacheKeys = Depends(Provide[Container.cache_keys]),
+        repository: UserRepository = Depends(Provide[Container.user_repository]),
+        sessions: RefreshSessionStore = Depends(Provide[Container.refresh_sessions]),
 ):
     if not await repository.delete_by_id(user.id):
         return Response(status_code=status.HTTP_400_BAD_REQUEST, content='User not found')
+    await cache.delete_many(await cached_user_keys(keys, user.id))
+    await sessions.revoke_all(user.id)
@@ -2,6 +2,9 @@ from fastapi import FastAPI
 
 from internal.app.api.api import api_v1_router
 from internal.app.container import Container
+from internal.db.pinning import ReadPinMiddleware
+from internal.pkg.metrics import MetricsMiddleware, metrics_endpoint
+from internal.pkg.profiling import ProfilingMiddleware
 
 
 def create_app() -> FastAPI:
@@ -20,4 +23,20 @@ def create_app() -> FastAPI:
     prefix = '/api/v1'
     application.include_router(api_v1_router, prefix=prefix)
 
+    if settings.DB_REPLICA_URLS:
+        application.add_middleware(ReadPinMiddleware, window=settings.DB_READ_YOUR_WRITES_WINDOW)
+
+    # Observability
+    if settings.PROFILING_DIR:
+        application.add_middleware(
+            ProfilingMiddleware,
+            directory=settings.PROFILING_DIR,
+            secret=settings.PROFILING_SECRET,
+            sample_rate=settings.PROFILING_SAMPLE_RATE,
+            interval=settings.PROFILING_INTERVAL,
+            output_format=settings.PROFILING_FORMAT,
+        )
+    application.add_middleware(MetricsMiddleware)
+    application.add_route('/metrics', metrics_endpoint, include_in_schema=False)
+
     return application
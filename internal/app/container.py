@@ -4,13 +4,19 @@ from dependency_injector import containers, providers
 
 from internal.app.settings import GlobalSettings
 from internal.db.database import PostgresDatabase
+from internal.db.repositories.batching import RepositoryBatcher
 from internal.db.repositories.user import UserRepository
-from internal.pkg.auth import AuthJWT
-from internal.pkg.cache import RedisCache
+from internal.pkg.auth import (AuthJWT, PasswordHasher, RefreshSessionStore,
+                               TokenCache)
+from internal.pkg.cache import (CacheKeys, CacheLoader, ExistenceFilter,
+                                RedisCache, TieredCache)
+from internal.pkg.metrics import LoopLagMonitor
+from internal.pkg.ratelimit import MemoryRateLimiter, RedisRateLimiter
 
 if TYPE_CHECKING:
     from internal.pkg.auth import Auth
     from internal.pkg.cache import Cache
+    from internal.pkg.ratelimit import RateLimiter
 
 
 class Container(containers.DeclarativeContainer):
@@ -18,6 +24,7 @@ class Container(containers.DeclarativeContainer):
     wiring_config = containers.WiringConfiguration(modules=[
         ".api.v1.users",
         ".api.v1.auth",
+        ".api.v1.admin",
         ".api.dependencies",
     ])
     settings: Callable[..., GlobalSettings] = providers.ThreadLocalSingleton(
@@ -25,23 +32,119 @@ class Container(containers.DeclarativeContainer):
     )
     s = settings()
 
-    cache: Callable[..., 'Cache'] = providers.ThreadLocalSingleton(
+    redis_cache: Callable[..., 'RedisCache'] = providers.ThreadLocalSingleton(
         RedisCache,
         host=s.REDIS_HOST,
         port=s.REDIS_PORT,
+        codec=s.CACHE_CODEC,
+        compress_threshold=s.CACHE_COMPRESS_THRESHOLD,
+        max_connections=s.REDIS_MAX_CONNECTIONS,
+        pool_timeout=s.REDIS_POOL_TIMEOUT,
+        socket_timeout=s.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=s.REDIS_SOCKET_CONNECT_TIMEOUT,
+        socket_keepalive=s.REDIS_SOCKET_KEEPALIVE,
+        health_check_interval=s.REDIS_HEALTH_CHECK_INTERVAL,
+    )
+
+    cache: Callable[..., 'Cache'] = providers.ThreadLocalSingleton(
+        TieredCache,
+        remote=redis_cache,
+        maxsize=s.CACHE_L1_MAXSIZE,
+        ttl=s.CACHE_L1_TTL,
+        channel=s.CACHE_INVALIDATION_CHANNEL,
+    )
+
+    cache_keys: Callable[..., 'CacheKeys'] = providers.ThreadLocalSingleton(
+        CacheKeys,
+        cache=cache,
+        namespace=s.CACHE_NAMESPACE,
+    )
+
+    cache_loader: Callable[..., 'CacheLoader'] = providers.ThreadLocalSingleton(
+        CacheLoader,
+        cache=cache,
+        lease_ttl=s.CACHE_LEASE_TTL,
+        lease_timeout=s.CACHE_LEASE_TIMEOUT,
+        stale_ttl=s.CACHE_STALE_TTL,
+        beta=s.CACHE_EARLY_REFRESH_BETA,
     )
 
     db: Callable[..., 'PostgresDatabase'] = providers.ThreadLocalSingleton(
         PostgresDatabase,
-        db_url=s.ASYNC_DB_URL
+        db_url=s.ASYNC_DB_URL,
+        echo=s.DB_ECHO,
+        pool_size=s.DB_WORKER_POOL_SIZE,
+        max_overflow=s.DB_WORKER_MAX_OVERFLOW,
+        pool_timeout=s.DB_POOL_TIMEOUT,
+        pool_recycle=s.DB_POOL_RECYCLE,
+        pool_pre_ping=s.DB_POOL_PRE_PING,
+        statement_cache_size=s.DB_STATEMENT_CACHE_SIZE,
+        replica_urls=s.ASYNC_DB_REPLICA_URLS,
+        max_replica_lag=s.DB_MAX_REPLICA_LAG,
+        replica_check_interval=s.DB_REPLICA_CHECK_INTERVAL,
+        read_your_writes_window=s.DB_READ_YOUR_WRITES_WINDOW,
+    )
+
+    hasher: Callable[..., 'PasswordHasher'] = providers.ThreadLocalSingleton(
+        PasswordHasher,
+        executor=s.HASH_EXECUTOR,
+        max_workers=s.HASH_WORKERS,
+        max_queue=s.HASH_QUEUE_SIZE,
+        rounds=s.BCRYPT_ROUNDS,
+    )
+
+    token_cache: Callable[..., 'TokenCache'] = providers.ThreadLocalSingleton(
+        TokenCache,
+        maxsize=s.TOKEN_CACHE_SIZE,
+        negative_ttl=s.TOKEN_CACHE_NEGATIVE_TTL,
+        negative_maxsize=s.TOKEN_CACHE_NEGATIVE_SIZE,
     )
 
     auth: Callable[..., 'Auth'] = providers.Factory(
         AuthJWT,
         secret_key=s.SECRET_KEY,
+        hasher=hasher,
+        token_cache=token_cache,
+        access_token_ttl=s.ACCESS_TOKEN_TTL,
+    )
+
+    refresh_sessions: Callable[..., 'RefreshSessionStore'] = providers.ThreadLocalSingleton(
+        RefreshSessionStore,
+        cache=cache,
+        ttl=s.REFRESH_TOKEN_TTL,
+        prefix=f'{s.CACHE_NAMESPACE}:refresh:',
+    )
+
+    rate_limiter: Callable[..., 'RateLimiter'] = providers.ThreadLocalSingleton(
+        RedisRateLimiter,
+        cache=redis_cache,
+        prefix=f'{s.CACHE_NAMESPACE}:rl:',
+    ) if s.RATE_LIMIT_BACKEND == 'redis' else providers.ThreadLocalSingleton(MemoryRateLimiter)
+
+    repository_batcher: Callable[..., 'RepositoryBatcher'] = providers.ThreadLocalSingleton(
+        RepositoryBatcher,
+        window=s.DB_BATCH_WINDOW_US / 1_000_000,
+        max_batch_size=s.DB_BATCH_MAX_SIZE,
     )
 
     user_repository: Callable[..., 'UserRepository'] = providers.Factory(
         UserRepository,
         context_async_session=db.provided.async_session,
+        context_read_session=db.provided.read_session,
+        batcher=repository_batcher if s.DB_BATCHING else None,
+        fast_reads=s.DB_FAST_READS,
+    )
+
+    user_filter: Callable[..., 'ExistenceFilter'] = providers.ThreadLocalSingleton(
+        ExistenceFilter,
+        page=user_repository.provided.list_after,
+        columns=('username', 'email'),
+        capacity=s.USER_FILTER_CAPACITY,
+        error_rate=s.USER_FILTER_ERROR_RATE,
+        refresh_interval=s.USER_FILTER_REFRESH_INTERVAL,
+    )
+
+    loop_monitor: Callable[..., 'LoopLagMonitor'] = providers.ThreadLocalSingleton(
+        LoopLagMonitor,
+        interval=s.METRICS_LOOP_LAG_INTERVAL,
     )
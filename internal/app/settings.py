@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import Literal, Optional
 
-from pydantic import BaseModel, BaseSettings
+from pydantic import BaseModel, BaseSettings, root_validator
 
 
 class AppConfig(BaseModel):
@@ -12,12 +12,138 @@ class GlobalSettings(BaseSettings):
     APP_CONFIG: AppConfig = AppConfig()
 
     DB_URL: str
+    DB_ECHO: bool = False
+    # Pool per gunicorn worker. With DB_CONNECTION_BUDGET set, the budget of the whole node is split
+    # between WEB_CONCURRENCY workers and DB_POOL_SIZE/DB_MAX_OVERFLOW are capped to fit into it.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_CONNECTION_BUDGET: Optional[int] = None
+    WEB_CONCURRENCY: int = 1
+    # Read replicas, JSON list of postgresql:// urls
+    DB_REPLICA_URLS: list[str] = []
+    DB_MAX_REPLICA_LAG: float = 5.0
+    DB_REPLICA_CHECK_INTERVAL: float = 2.0
+    # Seconds a client reads from the primary after its own write (cookie `db_pin`)
+    DB_READ_YOUR_WRITES_WINDOW: float = 5.0
 
     REDIS_HOST: Optional[str] = None
     REDIS_PORT: Optional[int] = None
+    # Connection pool, per gunicorn worker
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: Optional[float] = 5
+    REDIS_SOCKET_TIMEOUT: Optional[float] = 5
+    REDIS_SOCKET_CONNECT_TIMEOUT: Optional[float] = 5
+    REDIS_SOCKET_KEEPALIVE: bool = True
+    REDIS_HEALTH_CHECK_INTERVAL: float = 30
+
+    # Boot: pre-open DB_POOL_SIZE DB and REDIS_WARM_UP_CONNECTIONS Redis connections per worker
+    # and prepare the hot repository statements before serving
+    WARM_UP: bool = True
+    REDIS_WARM_UP_CONNECTIONS: int = 10
+
+    # Value encoding: json, orjson or msgpack (the latter two need the package installed)
+    CACHE_CODEC: Literal['json', 'orjson', 'msgpack'] = 'json'
+    # Values larger than this many bytes are zlib-compressed, None disables compression
+    CACHE_COMPRESS_THRESHOLD: Optional[int] = 1024
+    # Prefix of every key this service writes to the shared Redis
+    CACHE_NAMESPACE: str = 'sidus'
+
+    # In-process L1 in front of Redis, CACHE_L1_MAXSIZE=0 disables it
+    CACHE_L1_MAXSIZE: int = 4096
+    CACHE_L1_TTL: float = 5.0
+    CACHE_INVALIDATION_CHANNEL: str = 'cache:invalidate'
+
+    # Stampede protection for cache-aside reads
+    CACHE_LEASE_TTL: float = 5.0
+    CACHE_LEASE_TIMEOUT: float = 2.0
+    CACHE_STALE_TTL: float = 60.0
+    CACHE_EARLY_REFRESH_BETA: float = 1.0
+
+    # Coalesce concurrent repository reads into IN queries
+    DB_BATCHING: bool = False
+    DB_BATCH_WINDOW_US: int = 0
+    DB_BATCH_MAX_SIZE: int = 500
+    # Prepared asyncpg SELECTs mapped straight to schemas for hot repository reads
+    DB_FAST_READS: bool = False
 
     SECRET_KEY: str
+    # X-Admin-Token for /admin endpoints, admin endpoints are disabled when unset
+    ADMIN_TOKEN: Optional[str] = None
+    # Upper bound for how long a deleted/changed user may still authenticate on other nodes
+    PRINCIPAL_CACHE_TTL: float = 30.0
+    # Seconds. Access tokens carry the user's claims and can't be revoked, keep them short-lived
+    ACCESS_TOKEN_TTL: int = 15 * 60
+    REFRESH_TOKEN_TTL: int = 30 * 24 * 3600
+    # Verified access tokens, per worker
+    TOKEN_CACHE_SIZE: int = 10_000
+    TOKEN_CACHE_NEGATIVE_TTL: float = 5.0
+    TOKEN_CACHE_NEGATIVE_SIZE: int = 1_000
+
+    # bcrypt worker pool (per gunicorn worker)
+    HASH_EXECUTOR: Literal['thread', 'process', 'inline'] = 'thread'
+    HASH_WORKERS: Optional[int] = None
+    HASH_QUEUE_SIZE: int = 64
+    # Cost of new hashes, `python -m internal.cli.bcrypt_cost` calibrates it; older hashes are redone at sign-in
+    BCRYPT_ROUNDS: int = 12
+
+    # bcrypt routes: calls per RATE_LIMIT_PERIOD seconds per client IP and per username.
+    # `memory` keeps the counters per worker process
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: Literal['redis', 'memory'] = 'redis'
+    RATE_LIMIT_PERIOD: float = 60
+    RATE_LIMIT_SIGN_IN_PER_IP: int = 30
+    RATE_LIMIT_SIGN_IN_PER_USERNAME: int = 5
+    RATE_LIMIT_SIGN_UP_PER_IP: int = 5
+    RATE_LIMIT_SIGN_UP_PER_USERNAME: int = 3
+
+    # Per-worker bloom filters of taken usernames/emails, sign-up skips the duplicate check for names
+    # they don't contain. Rows added since the last refresh are read every USER_FILTER_REFRESH_INTERVAL seconds
+    USER_FILTER_ENABLED: bool = True
+    USER_FILTER_CAPACITY: int = 1_000_000
+    USER_FILTER_ERROR_RATE: float = 0.01
+    USER_FILTER_REFRESH_INTERVAL: float = 30
+
+    # Seconds between event loop lag samples for /metrics
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5
+
+    # Per-request profiling, off unless PROFILING_DIR is set. Requests are profiled when signed with
+    # PROFILING_SECRET (python -m internal.cli.profile_token) or sampled with PROFILING_SAMPLE_RATE
+    PROFILING_DIR: Optional[str] = None
+    PROFILING_SECRET: Optional[str] = None
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_INTERVAL: float = 0.001
+    PROFILING_FORMAT: Literal['speedscope', 'pstats', 'html'] = 'speedscope'
+
+    @root_validator(skip_on_failure=True)
+    def connection_budget_fits_workers(cls, values):
+        budget, workers = values['DB_CONNECTION_BUDGET'], values['WEB_CONCURRENCY']
+        if budget is not None and budget < workers:
+            raise ValueError(
+                f'DB_CONNECTION_BUDGET={budget} leaves no connection for some of WEB_CONCURRENCY={workers} workers'
+            )
+        return values
 
     @property
     def ASYNC_DB_URL(self) -> str:
         return self.DB_URL.replace('postgresql://', 'postgresql+asyncpg://')
+
+    @property
+    def ASYNC_DB_REPLICA_URLS(self) -> list[str]:
+        return [url.replace('postgresql://', 'postgresql+asyncpg://') for url in self.DB_REPLICA_URLS]
+
+    @property
+    def DB_WORKER_POOL_SIZE(self) -> int:
+        if self.DB_CONNECTION_BUDGET is None:
+            return self.DB_POOL_SIZE
+        return min(self.DB_POOL_SIZE, self.DB_CONNECTION_BUDGET // self.WEB_CONCURRENCY)
+
+    @property
+    def DB_WORKER_MAX_OVERFLOW(self) -> int:
+        if self.DB_CONNECTION_BUDGET is None:
+            return self.DB_MAX_OVERFLOW
+        spare = self.DB_CONNECTION_BUDGET // self.WEB_CONCURRENCY - self.DB_WORKER_POOL_SIZE
+        return max(0, min(self.DB_MAX_OVERFLOW, spare))
@@ -0,0 +1,53 @@
+""" Pick BCRYPT_ROUNDS for this hardware: the highest cost whose hash stays within the target latency.
+
+    python -m internal.cli.bcrypt_cost --target-ms 250
+
+Run it on the machine the API runs on, with nothing else loading the CPU. Raising the cost later is safe,
+users are rehashed with the new cost on their next sign-in.
+"""
+import argparse
+import statistics
+import time
+
+import bcrypt
+
+MIN_ROUNDS = 4
+MAX_ROUNDS = 20
+
+
+def measure(rounds: int, samples: int) -> float:
+    """ Median seconds per hash """
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration', bcrypt.gensalt(rounds))
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def calibrate(target: float, samples: int) -> tuple[int, dict[int, float]]:
+    """ :return: the chosen cost and the median latency of every measured cost """
+    timings = {}
+    chosen = MIN_ROUNDS
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        timings[rounds] = measure(rounds, samples)
+        if timings[rounds] > target:
+            break
+        chosen = rounds
+    return chosen, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target-ms', type=float, default=250, help='hashing latency to stay within')
+    parser.add_argument('--samples', type=int, default=5, help='hashes measured per cost')
+    args = parser.parse_args()
+
+    chosen, timings = calibrate(args.target_ms / 1000, args.samples)
+    for rounds, seconds in timings.items():
+        print(f'rounds={rounds:<3}{seconds * 1000:9.1f} ms')
+    print(f'BCRYPT_ROUNDS={chosen}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+""" Bulk user import.
+
+    python -m internal.cli.import_users users.csv        # header: username,email,password
+    python -m internal.cli.import_users users.ndjson     # {"username": ..., "email": ..., "password": ...}
+
+Passwords are hashed on every core, users are inserted `--batch-size` at a time.
+Prints a JSON report with the rejected (duplicate or invalid) rows.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+from typing import Iterator
+
+from pydantic import ValidationError
+
+from internal.app.container import Container
+from internal.models.schemas import InUserSchema
+from internal.pkg.auth import AuthJWT, PasswordHasher
+
+
+def read_rows(path: str) -> Iterator[dict]:
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(f)
+        else:
+            yield from (json.loads(line) for line in f if line.strip())
+
+
+async def import_users(path: str, batch_size: int, workers: int | None) -> dict:
+    container = Container()
+    settings = container.settings()
+    auth = AuthJWT(
+        secret_key=settings.SECRET_KEY,
+        hasher=PasswordHasher(executor='process', max_workers=workers, max_queue=0, rounds=settings.BCRYPT_ROUNDS),
+    )
+    repository = container.user_repository()
+    report = {'created': 0, 'rejected': [], 'invalid': []}
+
+    async def flush(batch: list[InUserSchema]):
+        hashed = await auth.encode_passwords_async([user.password for user in batch])
+        created, rejected = await repository.create_many(
+            [user.copy(update={'password': password}) for user, password in zip(batch, hashed)]
+        )
+        report['created'] += len(created)
+        report['rejected'].extend({'username': user.username, 'email': user.email} for user in rejected)
+
+    batch = []
+    try:
+        for line, row in enumerate(read_rows(path), start=1):
+            try:
+                batch.append(InUserSchema(**row))
+            except ValidationError as e:
+                report['invalid'].append({'line': line, 'errors': e.errors()})
+                continue
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+    finally:
+        auth.hasher.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='.csv or .ndjson file')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=None, help='hashing processes, all cores by default')
+    args = parser.parse_args()
+
+    report = asyncio.run(import_users(args.path, args.batch_size, args.workers))
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+""" Signed `X-Profile` header value for the profiling middleware.
+
+    curl -H "X-Profile: $(python -m internal.cli.profile_token)" .../api/v1/users/get/1
+
+Uses PROFILING_SECRET from the environment/.env, the response carries `X-Profile-Id`,
+the name of the file written to PROFILING_DIR.
+"""
+import argparse
+import sys
+
+from internal.app.settings import GlobalSettings
+from internal.pkg.profiling import sign_profile_token
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ttl', type=float, default=600, help='seconds the token stays valid')
+    args = parser.parse_args()
+
+    secret = GlobalSettings().PROFILING_SECRET
+    if not secret:
+        sys.exit('PROFILING_SECRET is not set')
+    print(sign_profile_token(secret, args.ttl))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,263 @@
+import asyncio
+import itertools
 import logging
+import os
+import time
 from asyncio import current_task
 from collections.abc import Generator
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Sequence
 
-from sqlalchemy import orm
-from sqlalchemy.ext.asyncio import (AsyncSession, async_scoped_session,
-                                    create_async_engine)
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import event, orm, text
+from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
+                                    async_scoped_session, create_async_engine)
 
+from internal.db.pinning import current_pin
+from internal.db.pool import InstrumentedPool
 from internal.db.tables.base import Base
+from internal.pkg.metrics import DB_QUERY_DURATION
 
 logger = logging.getLogger(__name__)
 
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+# Same key in every worker, transaction-scoped so it can't outlive a crashed bootstrap
+SCHEMA_LOCK_ID = 0x51D05_5C4E
+SCHEMA_LOCK_QUERY = text('SELECT pg_advisory_xact_lock(:id)')
+
+
+def alembic_head_applied(connection) -> bool:
+    """ Whether the database is at the latest migration, `connection` is a sync one """
+    current = set(MigrationContext.configure(connection).get_current_heads())
+    return bool(current) and current == set(ScriptDirectory(MIGRATIONS_DIR).get_heads())
+
+
+def instrument_engine(engine: AsyncEngine, database: str) -> None:
+    """ Observe every statement executed through `engine` in DB_QUERY_DURATION """
+    histogram = DB_QUERY_DURATION.labels(database)
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        histogram.observe(time.perf_counter() - conn.info['query_started'].pop())
+
+    @event.listens_for(engine.sync_engine, 'handle_error')
+    def handle_error(context):
+        if started := context.connection.info.get('query_started'):
+            started.pop()
+
+
+# Session.info flags: the open transaction has written / a transaction that wrote was committed
+WRITES = 'writes'
+COMMITTED_WRITES = 'committed_writes'
+
+
+class WriteTrackingSession(orm.Session):
+    """ Primary sessions, flag commits that actually wrote so reads can be pinned to the primary """
+
+
+@event.listens_for(WriteTrackingSession, 'do_orm_execute')
+def _track_statement(orm_execute_state: orm.ORMExecuteState) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[WRITES] = True
+
+
+@event.listens_for(WriteTrackingSession, 'after_flush')
+def _track_flush(session: orm.Session, flush_context) -> None:
+    session.info[WRITES] = True
+
+
+@event.listens_for(WriteTrackingSession, 'after_commit')
+def _track_commit(session: orm.Session) -> None:
+    if session.info.pop(WRITES, False):
+        session.info[COMMITTED_WRITES] = True
+
+
+@event.listens_for(WriteTrackingSession, 'after_rollback')
+def _track_rollback(session: orm.Session) -> None:
+    session.info.pop(WRITES, None)
+
+
+@dataclass(eq=False)
+class Replica:
+    engine: AsyncEngine
+    session_factory: Callable[[], AsyncSession]
+    lag: float | None = None  # seconds, None until checked or when unreachable
+
 
 class PostgresDatabase:
-    def __init__(self, db_url: str) -> None:
-        self._engine = create_async_engine(db_url, echo=True)
+    def __init__(
+            self,
+            db_url: str,
+            echo: bool = False,
+            pool_size: int = 5,
+            max_overflow: int = 10,
+            pool_timeout: float = 30,
+            pool_recycle: int = -1,
+            pool_pre_ping: bool = False,
+            statement_cache_size: int = 100,
+            replica_urls: Sequence[str] = (),
+            max_replica_lag: float = 5.0,
+            replica_check_interval: float = 2.0,
+            read_your_writes_window: float = 5.0,
+    ) -> None:
+        """ Pool limits are per process, i.e. per gunicorn worker, and apply to every engine.
+
+        :param statement_cache_size: prepared statements kept per connection by the asyncpg adapter
+        :param replica_urls: read-only replicas used by `read_session`
+        :param max_replica_lag: replicas lagging more than this many seconds are not read from
+        :param read_your_writes_window: seconds after a client's committed write when its reads go to the primary,
+            see `internal.db.pinning`
+        """
+        engine_kwargs = dict(
+            echo=echo,
+            poolclass=InstrumentedPool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+            connect_args={'prepared_statement_cache_size': statement_cache_size},
+        )
+        self.pool_size = pool_size
+        self._engine = create_async_engine(db_url, execution_options={'database': 'primary'}, **engine_kwargs)
+        instrument_engine(self._engine, 'primary')
         self._async_session_factory = async_scoped_session(
             orm.sessionmaker(
                 class_=AsyncSession,  # <- use Session.future=True mode (exclude autocommit=True)
+                sync_session_class=WriteTrackingSession,
                 expire_on_commit=False,
                 bind=self._engine,
             ),
             scopefunc=current_task,
         )
 
+        self._replicas = []
+        for url in replica_urls:
+            engine = create_async_engine(url, execution_options={'database': 'replica'}, **engine_kwargs)
+            instrument_engine(engine, 'replica')
+            factory = orm.sessionmaker(class_=AsyncSession, expire_on_commit=False, bind=engine)
+            self._replicas.append(Replica(engine=engine, session_factory=factory))
+        self._next_replica = itertools.cycle(self._replicas)
+        self.max_replica_lag = max_replica_lag
+        self.replica_check_interval = replica_check_interval
+        self.read_your_writes_window = read_your_writes_window
+        self._replica_monitor: asyncio.Task | None = None
+
+    def pool_status(self) -> dict:
+        return {
+            'primary': self._engine.pool.status_dict(),
+            'replicas': [
+                {'host': replica.engine.url.host, 'lag': replica.lag, **replica.engine.pool.status_dict()}
+                for replica in self._replicas
+            ],
+        }
+
     async def init_db(self) -> None:
+        """ Create missing tables, unless migrations are managed with Alembic and the head is applied.
+
+        Every gunicorn worker runs this at boot: the advisory lock lets the first one create the schema,
+        the rest wait for its transaction and then find nothing to create.
+        """
         async with self._engine.begin() as conn:
+            if await conn.run_sync(alembic_head_applied):
+                return
+            await conn.execute(SCHEMA_LOCK_QUERY, {'id': SCHEMA_LOCK_ID})
             await conn.run_sync(Base.metadata.create_all)
 
+    async def warm_up(self, prime: Callable[[], Awaitable] | None = None, connections: int | None = None) -> None:
+        """ Open `connections` (`pool_size` by default) pooled connections to every healthy engine at once,
+        then run `prime` as many times concurrently, so the pooled connections prepare the hot statements.
+        """
+        connections = connections or self.pool_size
+        engines = [self._engine, *(replica.engine for replica in self._replicas if replica.lag is not None)]
+
+        async def connect(engine: AsyncEngine) -> None:
+            async with engine.connect() as conn:
+                await conn.execute(text('SELECT 1'))
+
+        phases = [[connect(engine) for engine in engines for _ in range(connections)]]
+        if prime is not None:
+            phases.append([prime() for _ in range(connections)])
+        for calls in phases:
+            for result in await asyncio.gather(*calls, return_exceptions=True):
+                if isinstance(result, Exception):
+                    logger.warning("Database warm-up failed: %r", result)
+
+    async def startup(self) -> None:
+        if self._replicas and self._replica_monitor is None:
+            await self.check_replicas()
+            self._replica_monitor = asyncio.create_task(self._monitor_replicas())
+
+    async def shutdown(self) -> None:
+        if self._replica_monitor is not None:
+            self._replica_monitor.cancel()
+            self._replica_monitor = None
+        for engine in [self._engine, *(replica.engine for replica in self._replicas)]:
+            await engine.dispose()
+
+    async def check_replicas(self) -> None:
+        for replica in self._replicas:
+            try:
+                async with replica.engine.connect() as conn:
+                    replica.lag = float((await conn.execute(REPLICA_LAG_QUERY)).scalar())
+            except Exception:
+                logger.exception("Replica %s is unreachable", replica.engine.url.host)
+                replica.lag = None
+
+    async def _monitor_replicas(self) -> None:
+        while True:
+            await asyncio.sleep(self.replica_check_interval)
+            await self.check_replicas()
+
+    def _read_replica(self) -> Replica | None:
+        """ Next healthy replica, None when reads must go to the primary """
+        if (pin := current_pin.get()) is not None and pin.active:
+            return None
+        for _ in range(len(self._replicas)):
+            replica = next(self._next_replica)
+            if replica.lag is not None and replica.lag <= self.max_replica_lag:
+                return replica
+        return None
+
     @asynccontextmanager
     async def async_session(self) -> Generator[AsyncSession, None, None]:
-        async_session = self._async_session_factory()
+        """ Primary session. A committed write pins the client's `read_session` to the primary
+        for `read_your_writes_window`
+        """
+        async with self._session(self._async_session_factory) as session:
+            yield session
+            if session.sync_session.info.pop(COMMITTED_WRITES, False):
+                self.pin_reads()
+
+    def pin_reads(self) -> None:
+        if (pin := current_pin.get()) is not None:
+            pin.until = max(pin.until, time.time() + self.read_your_writes_window)
+
+    @asynccontextmanager
+    async def read_session(self) -> Generator[AsyncSession, None, None]:
+        """ Replica session for reads, falls back to the primary """
+        replica = self._read_replica()
+        factory = self._async_session_factory if replica is None else replica.session_factory
+        async with self._session(factory) as session:
+            yield session
+
+    @asynccontextmanager
+    async def _session(self, factory: Callable[[], AsyncSession]) -> Generator[AsyncSession, None, None]:
+        async_session = factory()
         try:
             yield async_session
         except Exception:
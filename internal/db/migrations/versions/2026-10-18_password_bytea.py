@@ -0,0 +1,37 @@
+"""password bytea
+
+Revision ID: 3b7d91e0c4f2
+Revises: 8c2f4e1d9a30
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3b7d91e0c4f2'
+down_revision = '8c2f4e1d9a30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Hashes were stored as str(bytes), i.e. b'$2b$...'
+    op.alter_column(
+        'user', 'password',
+        type_=sa.LargeBinary(length=60),
+        existing_type=sa.String(),
+        existing_nullable=True,
+        postgresql_using="convert_to(CASE WHEN password LIKE 'b''%''' "
+                         "THEN substr(password, 3, length(password) - 3) ELSE password END, 'UTF8')",
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'user', 'password',
+        type_=sa.String(),
+        existing_type=sa.LargeBinary(length=60),
+        existing_nullable=True,
+        postgresql_using="'b''' || convert_from(password, 'UTF8') || ''''",
+    )
@@ -0,0 +1,23 @@
+"""user version
+
+Revision ID: 8c2f4e1d9a30
+Revises: 51a7070db33b
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '8c2f4e1d9a30'
+down_revision = '51a7070db33b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('user', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('user', 'version')
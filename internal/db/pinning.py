@@ -0,0 +1,67 @@
+""" Read-your-writes per client.
+
+After a client's request commits a write, that client's reads go to the primary for
+`read_your_writes_window` seconds. The deadline travels in a cookie, so it holds across
+gunicorn workers and nodes, and other clients keep reading from the replicas.
+"""
+import math
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from http.cookies import SimpleCookie
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+@dataclass
+class ReadPin:
+    """ Wall clock time until which the current client reads from the primary """
+    until: float = 0.0
+
+    @property
+    def active(self) -> bool:
+        return time.time() < self.until
+
+
+# Mutable, so a write in a task copied from the request context still reaches the middleware
+current_pin: ContextVar[ReadPin | None] = ContextVar('db_read_pin', default=None)
+
+
+class ReadPinMiddleware:
+    def __init__(self, app: ASGIApp, window: float = 5.0, cookie: str = 'db_pin'):
+        self.app = app
+        self.window = window
+        self.cookie = cookie
+
+    def _read_cookie(self, scope: Scope) -> float:
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                morsel = SimpleCookie(value.decode('latin-1')).get(self.cookie)
+                try:
+                    # A client can only pin itself, and not for longer than the window
+                    return min(float(morsel.value), time.time() + self.window) if morsel else 0.0
+                except ValueError:
+                    return 0.0
+        return 0.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        pin = ReadPin(self._read_cookie(scope))
+        received_until = pin.until
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start' and pin.until > received_until:
+                max_age = math.ceil(pin.until - time.time())
+                MutableHeaders(scope=message).append(
+                    'set-cookie', f'{self.cookie}={pin.until:.3f}; Max-Age={max_age}; Path=/; HttpOnly; SameSite=Lax',
+                )
+            await send(message)
+
+        token = current_pin.set(pin)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_pin.reset(token)
@@ -0,0 +1,50 @@
+import time
+from dataclasses import asdict, dataclass
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+@dataclass
+class PoolMetrics:
+    checkouts: int = 0
+    overflow_checkouts: int = 0
+    timeouts: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+    def dict(self) -> dict:
+        return asdict(self)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """ Counts checkouts and how long they took (queueing, connecting and pre-ping included) """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+
+        self.metrics.checkouts += 1
+        self.metrics.wait_seconds_total += waited
+        self.metrics.wait_seconds_max = max(self.metrics.wait_seconds_max, waited)
+        if self.checkedout() > self.size():
+            self.metrics.overflow_checkouts += 1
+        return connection
+
+    def status_dict(self) -> dict:
+        return {
+            'size': self.size(),
+            'checked_out': self.checkedout(),
+            'checked_in': self.checkedin(),
+            'overflow': self.overflow(),
+            **self.metrics.dict(),
+        }
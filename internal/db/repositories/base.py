@@ -1,24 +1,46 @@
 import abc
 from contextlib import AbstractContextManager
-from typing import Callable, Generic, Type, TypeVar
+from typing import AsyncIterator, Callable, Generic, Sequence, Type, TypeVar
 
 from asyncpg import UniqueViolationError
-from sqlalchemy import delete, select, update
+from sqlalchemy import any_, bindparam, delete, select, sql, text, tuple_, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from internal.db.errors import UserAlreadyExists
+from internal.db.repositories.batching import RepositoryBatcher
 from internal.models.schemas import BaseSchema
+from internal.pkg.metrics import DB_QUERY_DURATION
 
 IN_SCHEMA = TypeVar("IN_SCHEMA", bound=BaseSchema)
 SCHEMA = TypeVar("SCHEMA", bound=BaseSchema)
 TABLE = TypeVar("TABLE")
 
+# (repository class, filter columns, many) -> SQL for the ORM-free read path
+_FAST_QUERIES: dict[tuple[type, tuple[str, ...], bool], str] = {}
+
 
 class BaseRepository(Generic[IN_SCHEMA, SCHEMA, TABLE], metaclass=abc.ABCMeta):
 
-    def __init__(self, context_async_session: Callable[..., AbstractContextManager[AsyncSession]]) -> None:
+    def __init__(
+            self,
+            context_async_session: Callable[..., AbstractContextManager[AsyncSession]],
+            batcher: RepositoryBatcher | None = None,
+            context_read_session: Callable[..., AbstractContextManager[AsyncSession]] | None = None,
+            fast_reads: bool = False,
+    ) -> None:
+        """
+        :param batcher: coalesce concurrent `get_by_id`/`get` calls into `IN` queries
+        :param context_read_session: session for read methods (e.g. on a replica), defaults to `context_async_session`
+        :param fast_reads: serve `get_by_id`/`get`/`get_many_by` with prepared SQL straight on the asyncpg
+            connection, mapping rows to schemas without the ORM and without validation
+        """
         self.context_async_session = context_async_session
+        self.context_read_session = context_read_session or context_async_session
+        self.batcher = batcher
+        self.fast_reads = fast_reads
 
     @property
     @abc.abstractmethod
@@ -35,6 +57,67 @@ class BaseRepository(Generic[IN_SCHEMA, SCHEMA, TABLE], metaclass=abc.ABCMeta):
     def _schema(self) -> Type[SCHEMA]:
         ...
 
+    @property
+    def _order_by(self) -> tuple[str, ...]:
+        """ Columns allowed in `list_after(order_by=...)`, should be indexed """
+        return ('id',)
+
+    def keyset(self, order_by: str = 'id') -> tuple[str, ...]:
+        """ Columns of the seek key for `order_by`, the primary key breaks ties """
+        if order_by not in self._order_by:
+            raise ValueError(f'Can`t order {self._table.__name__} by {order_by!r}')
+        return (order_by,) if order_by == 'id' else (order_by, 'id')
+
+    def _keyset_query(self, cursor: Sequence | None, order_by: str):
+        columns = [getattr(self._table, name) for name in self.keyset(order_by)]
+        q = select(self._table).order_by(*columns)
+        if cursor is not None:
+            q = q.where(tuple_(*columns) > tuple_(*cursor))
+        return q
+
+    def _fast_query(self, columns: tuple[str, ...], many: bool = False) -> str:
+        key = (type(self), columns, many)
+        if (sql := _FAST_QUERIES.get(key)) is None:
+            dialect = postgresql.dialect()
+            quote = dialect.identifier_preparer.quote
+            table = self._table.__table__
+            if many:
+                [name] = columns
+                array_type = table.c[name].type.compile(dialect=dialect)
+                where = f'{quote(name)} = ANY($1::{array_type}[])'
+            else:
+                where = ' AND '.join(f'{quote(name)} = ${i}' for i, name in enumerate(columns, start=1)) + ' LIMIT 1'
+            sql = _FAST_QUERIES[key] = (
+                f'SELECT {", ".join(quote(column.name) for column in table.columns)} '
+                f'FROM {quote(table.name)} WHERE {where}'
+            )
+        return sql
+
+    def _from_record(self, record) -> SCHEMA:
+        values = dict(record)
+        for name, field in self._schema.__fields__.items():
+            if field.type_ is bytes and isinstance(values.get(name), str):
+                values[name] = values[name].encode('utf-8')
+        return self._schema.construct(**values)
+
+    async def _fetch(self, sql: str, *args, many: bool = False):
+        session: AsyncSession
+
+        async with self.context_read_session() as session:
+            connection = await session.connection()
+            database = connection.sync_connection.get_execution_options().get('database', 'primary')
+            driver = (await connection.get_raw_connection()).driver_connection
+            # Autocommit single statement: no BEGIN/ROLLBACK round trips, asyncpg caches the prepared statement
+            with DB_QUERY_DURATION.labels(database).time():
+                if many:
+                    return await driver.fetch(sql, *args)
+                return await driver.fetchrow(sql, *args)
+
+    async def warm_up(self) -> None:
+        """ Run the hot lookups with a key that matches nothing, so the connection prepares their statements """
+        await self.get_by_id(0)
+        await self.get_many_by('id', [0])
+
     async def create(self, in_schema: IN_SCHEMA) -> SCHEMA | None:
         session: AsyncSession
 
@@ -47,19 +130,140 @@ class BaseRepository(Generic[IN_SCHEMA, SCHEMA, TABLE], metaclass=abc.ABCMeta):
             except (IntegrityError, UniqueViolationError):
                 return None
 
-    async def get_by_id(self, entry_id: int) -> SCHEMA | None:
+    async def create_many(self, in_schemas: Sequence[IN_SCHEMA]) -> tuple[list[SCHEMA], list[IN_SCHEMA]]:
+        """ Bulk insert: COPY into a temporary staging table, then `INSERT ... ON CONFLICT DO NOTHING`.
+
+        :return: created entries and the input entries rejected as duplicates (of existing rows or
+            of earlier entries in `in_schemas`), matched by the table's unique columns.
+        """
         session: AsyncSession
 
+        if not in_schemas:
+            return [], []
+
+        table = self._table.__table__
+        columns = list(self._in_schema.__fields__)
+        unique = [column.name for column in table.columns if column.unique] or columns
+
         async with self.context_async_session() as session:
+            quote = session.bind.dialect.identifier_preparer.quote
+            staging = f'_import_{table.name}'
+
+            # Opens the session's transaction, COPY on the driver connection runs inside it
+            await session.execute(text(
+                f'CREATE TEMPORARY TABLE {quote(staging)} (LIKE {quote(table.name)} INCLUDING DEFAULTS) '
+                f'ON COMMIT DROP'
+            ))
+            driver = (await (await session.connection()).get_raw_connection()).driver_connection
+            await driver.copy_records_to_table(
+                staging,
+                records=[tuple(getattr(entry, column) for column in columns) for entry in in_schemas],
+                columns=columns,
+            )
+            q = (
+                postgresql.insert(table)
+                .from_select(
+                    columns,
+                    select(*sql.table(staging, *map(sql.column, columns)).columns),
+                    include_defaults=False,
+                )
+                .on_conflict_do_nothing()
+                .returning(*table.columns)
+            )
+            rows = [row._asdict() for row in await session.execute(q)]
+            await session.commit()
+
+        created = [self._schema.parse_obj(row) for row in rows]
+        inserted = {tuple(row[column] for column in unique) for row in rows}
+        rejected = []
+        for entry in in_schemas:
+            key = tuple(getattr(entry, column) for column in unique)
+            if key in inserted:
+                inserted.remove(key)
+            else:
+                rejected.append(entry)
+        return created, rejected
+
+    async def get_by_id(self, entry_id: int) -> SCHEMA | None:
+        session: AsyncSession
+
+        if self.batcher is not None:
+            return await self.batcher.loader(self, 'id').load(entry_id)
+
+        if self.fast_reads:
+            record = await self._fetch(self._fast_query(('id',)), entry_id)
+            return self._from_record(record) if record else None
+
+        async with self.context_read_session() as session:
             entry = await session.get(self._table, entry_id)
             if not entry:
                 return None
             return self._schema.from_orm(entry)
 
+    async def get_many(self, entry_ids: list[int]) -> list[SCHEMA]:
+        """ Single `WHERE id = ANY($1)` query, order of the result is not defined """
+        return list((await self.get_many_by('id', entry_ids)).values())
+
+    async def get_many_by(self, column: str, values: list) -> dict[any, SCHEMA]:
+        """ Entries whose `column` is one of `values`, keyed by that column. `column` should be unique. """
+        session: AsyncSession
+
+        if not values:
+            return {}
+
+        if self.fast_reads:
+            records = await self._fetch(self._fast_query((column,), many=True), list(values), many=True)
+            return {record[column]: self._from_record(record) for record in records}
+
+        async with self.context_read_session() as session:
+            field = getattr(self._table, column)
+            q = select(self._table).where(field == any_(bindparam('values', list(values), type_=ARRAY(field.type))))
+            entries = (await session.execute(q)).scalars()
+            return {getattr(entry, column): self._schema.from_orm(entry) for entry in entries}
+
+    async def list_after(self, cursor: Sequence | None = None, limit: int = 100, order_by: str = 'id') -> list[SCHEMA]:
+        """ Keyset (seek) pagination.
+
+        :param cursor: values of `keyset(order_by)` of the last seen entry, None for the first page
+        """
+        session: AsyncSession
+
+        async with self.context_read_session() as session:
+            q = self._keyset_query(cursor, order_by).limit(limit)
+            entries = (await session.execute(q)).scalars()
+            return [self._schema.from_orm(entry) for entry in entries]
+
+    async def stream_after(
+            self,
+            cursor: Sequence | None = None,
+            limit: int | None = None,
+            order_by: str = 'id',
+            chunk_size: int = 1000,
+    ) -> AsyncIterator[SCHEMA]:
+        """ Same as `list_after`, but rows come from a server-side cursor `chunk_size` at a time """
+        session: AsyncSession
+
+        async with self.context_read_session() as session:
+            q = self._keyset_query(cursor, order_by).limit(limit).execution_options(max_row_buffer=chunk_size)
+            result = await session.stream(q)
+            async for entry in result.scalars():
+                yield self._schema.from_orm(entry)
+
     async def get(self, **filters) -> SCHEMA | None:
         session: AsyncSession
 
-        async with self.context_async_session() as session:
+        if self.batcher is not None and len(filters) == 1:
+            [(column, value)] = filters.items()
+            field = getattr(self._table, column)
+            if field.primary_key or field.unique:
+                return await self.batcher.loader(self, column).load(value)
+
+        if self.fast_reads:
+            columns = tuple(sorted(filters))
+            record = await self._fetch(self._fast_query(columns), *(filters[column] for column in columns))
+            return self._from_record(record) if record else None
+
+        async with self.context_read_session() as session:
             q = select(self._table).filter_by(**filters)
             entry = await session.execute(q)
             if result := entry.scalar():
@@ -70,6 +274,9 @@ class BaseRepository(Generic[IN_SCHEMA, SCHEMA, TABLE], metaclass=abc.ABCMeta):
     async def update_by_id(self, _id: int, **fields) -> SCHEMA | None:
         session: AsyncSession
 
+        if 'version' in self._table.__table__.c:
+            fields['version'] = self._table.version + 1
+
         async with self.context_async_session() as session:
             q = update(self._table).where(self._table.id == _id).values(**fields).returning(self._table)
             result = (await session.execute(q)).fetchone()
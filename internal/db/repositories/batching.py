@@ -0,0 +1,88 @@
+import asyncio
+from typing import TYPE_CHECKING, Awaitable, Callable, Generic, Hashable, TypeVar
+
+from internal.db.pinning import current_pin
+
+if TYPE_CHECKING:
+    from internal.db.repositories.base import BaseRepository
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BatchLoader(Generic[K, V]):
+    """ DataLoader: `load(key)` calls made within `window` seconds (0 - the same event-loop tick)
+    are resolved together by a single `batch_fn(keys)` call.
+    """
+
+    def __init__(
+            self,
+            batch_fn: Callable[[list[K]], Awaitable[dict[K, V]]],
+            window: float = 0.0,
+            max_batch_size: int = 500,
+    ):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: dict[K, asyncio.Future] = {}
+        self._handle: asyncio.Handle | None = None
+        # The loop only keeps weak references to tasks
+        self._running: set[asyncio.Task] = set()
+
+    async def load(self, key: K) -> V | None:
+        if (future := self._pending.get(key)) is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[key] = loop.create_future()
+            if len(self._pending) >= self.max_batch_size:
+                self._dispatch()
+            elif self._handle is None:
+                self._handle = loop.call_soon(self._dispatch) if self.window <= 0 \
+                    else loop.call_later(self.window, self._dispatch)
+        # Other callers wait for the same key, a cancelled request must not cancel it for them
+        return await asyncio.shield(future)
+
+    def _dispatch(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: dict[K, asyncio.Future]) -> None:
+        try:
+            results = await self.batch_fn(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(results.get(key))
+
+
+class RepositoryBatcher:
+    """ Per-worker registry of `BatchLoader`s, one per repository class, lookup column and read options.
+
+    Repositories are created per request; instances reading the same way share a loader. A batch runs in
+    the context of the request that started it, so clients pinned to the primary get loaders of their own.
+    """
+
+    def __init__(self, window: float = 0.0, max_batch_size: int = 500):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._loaders: dict[tuple, BatchLoader] = {}
+
+    def loader(self, repository: 'BaseRepository', column: str) -> BatchLoader:
+        pinned = (pin := current_pin.get()) is not None and pin.active
+        key = (type(repository), column, repository.context_read_session, repository.fast_reads, pinned)
+        if (loader := self._loaders.get(key)) is None:
+            loader = self._loaders[key] = BatchLoader(
+                lambda values: repository.get_many_by(column, values),
+                window=self.window,
+                max_batch_size=self.max_batch_size,
+            )
+        return loader
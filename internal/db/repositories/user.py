@@ -1,5 +1,8 @@
 from typing import Type
 
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from internal.db.repositories.base import BaseRepository
 from internal.db.tables.user import User
 from internal.models.schemas import InUserSchema, UserSchema
@@ -17,3 +20,21 @@ class UserRepository(BaseRepository[InUserSchema, UserSchema, User]):
     @property
     def _table(self) -> Type[User]:
         return User
+
+    @property
+    def _order_by(self) -> tuple[str, ...]:
+        return 'id', 'username', 'email'
+
+    async def warm_up(self) -> None:
+        await super().warm_up()
+        # Sign-in lookup
+        await self.get(username='')
+
+    async def update_password(self, _id: int, password: bytes) -> bool:
+        """ Unlike `update_by_id` keeps the version, the hash is not part of any representation of the user """
+        session: AsyncSession
+
+        async with self.context_async_session() as session:
+            result = await session.execute(update(User).where(User.id == _id).values(password=password))
+            await session.commit()
+            return bool(result.rowcount)
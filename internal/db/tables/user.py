@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, LargeBinary, String, TypeDecorator
+from sqlalchemy import Column, Integer, LargeBinary, String
 
 from internal.db.tables.base import Base
 
@@ -7,9 +7,12 @@ class User(Base):
     __tablename__ = 'user'
 
     id = Column('id', Integer, primary_key=True)
-    password = Column(String)
+    # bcrypt hash as is, `$2b$<rounds>$<salt><digest>`
+    password = Column(LargeBinary(60))
     username = Column(String(55), unique=True)
     email = Column(String(200), unique=True)
+    # Bumped on every update, exposed to clients as the ETag
+    version = Column(Integer, nullable=False, default=1, server_default='1')
 
     def __repr__(self):
         return f"<User(id={self.id}, " \
@@ -0,0 +1,20 @@
+""" gunicorn hooks for prometheus_client multiprocess mode.
+
+    gunicorn -c python:internal.gunicorn_conf ... internal.main:app
+"""
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # Samples of workers from a previous run would be aggregated forever
+    if path := os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
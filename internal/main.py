@@ -1,3 +1,5 @@
+import asyncio
+
 from internal.app.app import create_app
 
 app = create_app()
@@ -5,10 +7,30 @@ app = create_app()
 
 @app.on_event("startup")
 async def on_startup():
-    # TODO: не критичный баг из-за threding миграций
-    # <duplicate key value violates unique constraint "pg_type_typname_nsp_index">
-    await app.container.db().init_db()
-    await app.container.cache().ping()
+    settings = app.container.settings()
+    db, cache = app.container.db(), app.container.cache()
+
+    await db.init_db()
+    await db.startup()
+    await cache.ping()
+    await cache.startup()
+    if settings.WARM_UP:
+        await asyncio.gather(
+            db.warm_up(app.container.user_repository().warm_up),
+            cache.warm_up(settings.REDIS_WARM_UP_CONNECTIONS),
+        )
+    app.container.loop_monitor().start()
+    if settings.USER_FILTER_ENABLED:
+        app.container.user_filter().start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await app.container.loop_monitor().stop()
+    await app.container.user_filter().stop()
+    await app.container.cache().shutdown()
+    app.container.hasher().shutdown()
+    await app.container.db().shutdown()
 
 
 @app.get("/")
@@ -25,7 +25,14 @@ class InUserSchema(UserSchemaBase):
 class UserSchema(UserSchemaBase):
     id: int
     password: bytes
+    version: int = 1
 
 
 class OutUserSchema(UserSchemaBase):
     id: int
+
+
+class PrincipalSchema(UserSchemaBase):
+    """ Authenticated user as seen by handlers, without credentials """
+    id: int
+    version: int = 1
@@ -1,4 +1,7 @@
 from .auth_jwt import AuthJWT
+from .hasher import HashingQueueFull, PasswordHasher
 from .interface import Auth
+from .sessions import RefreshSessionStore
+from .token_cache import TokenCache
 
-__all__ = ['Auth', 'AuthJWT']
+__all__ = ['Auth', 'AuthJWT', 'HashingQueueFull', 'PasswordHasher', 'RefreshSessionStore', 'TokenCache']
@@ -1,20 +1,40 @@
+import time
 from datetime import datetime, timedelta
+from typing import Awaitable, TypeVar
 
 import bcrypt
 from fastapi import HTTPException
 from jose import jwt
+from starlette import status
 
+from internal.pkg.auth.hasher import HashingQueueFull, PasswordHasher
 from internal.pkg.auth.interface import Auth
+from internal.pkg.auth.token_cache import TokenCache
+from internal.pkg.metrics import PASSWORD_HASH_DURATION
+
+T = TypeVar("T")
 
 
 class AuthJWT(Auth):
-    def __init__(self, secret_key: str, algo: str = 'HS256') -> None:
+    def __init__(
+            self,
+            secret_key: str,
+            algo: str = 'HS256',
+            hasher: PasswordHasher | None = None,
+            token_cache: TokenCache | None = None,
+            access_token_ttl: float = 30 * 60,
+    ) -> None:
         self.secret_key = secret_key
         self.algo = algo
+        self.hasher = hasher or PasswordHasher()
+        self.token_cache = token_cache
+        self.access_token_ttl = access_token_ttl
 
-    def encode_token(self, user_id: int | str):
+    def encode_token(self, user_id: int | str, claims: dict | None = None):
+        """ :param claims: extra payload, e.g. what handlers need to know about the user without loading it """
         payload = {
-            'exp': datetime.utcnow() + timedelta(days=0, minutes=30),
+            **(claims or {}),
+            'exp': datetime.utcnow() + timedelta(seconds=self.access_token_ttl),
             'iat': datetime.utcnow(),
             'scope': 'access_token',
             'sub': str(user_id)
@@ -26,10 +46,32 @@ class AuthJWT(Auth):
         )
 
     def decode_token(self, token: str) -> str:
+        return self.decode_claims(token)['sub']
+
+    def decode_claims(self, token: str) -> dict:
+        if self.token_cache is None:
+            return self._decode_token(token)
+
+        key = self.token_cache.digest(token)
+        if cached := self.token_cache.get(key):
+            valid, value = cached
+            if valid:
+                return value
+            raise HTTPException(status_code=401, detail=value)
+
+        try:
+            payload = self._decode_token(token)
+        except HTTPException as e:
+            self.token_cache.reject(key, e.detail)
+            raise
+        self.token_cache.accept(key, payload, payload['exp'])
+        return payload
+
+    def _decode_token(self, token: str) -> dict:
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algo])
             if payload.get('scope') == 'access_token':
-                return payload['sub']
+                return payload
             raise HTTPException(status_code=401, detail='Scope for the token is invalid')
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=401, detail='Token expired')
@@ -38,10 +80,40 @@ class AuthJWT(Auth):
 
     @staticmethod
     def verify_password(plain_password: str, hashed_password: bytes) -> bool:
-        # SQLAlchemy ужасно работает с LargeBytes, по этому пароль хранится, как str(bytes(...))
-        hashed_password = hashed_password.decode('utf-8')[2:-1]
-        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password)
 
     @staticmethod
-    def encode_password(password: str) -> bytes:
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    def encode_password(password: str, rounds: int = 12) -> bytes:
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds))
+
+    def needs_rehash(self, hashed_password: bytes) -> bool:
+        """ The hash was made with another cost than new hashes get """
+        return self.hasher.needs_rehash(hashed_password)
+
+    async def verify_password_async(self, plain_password: str, hashed_password: bytes) -> bool:
+        return await self._hashing('check', self.hasher.check(plain_password.encode('utf-8'), hashed_password))
+
+    async def encode_password_async(self, password: str) -> bytes:
+        return await self._hashing('hash', self.hasher.hash(password.encode('utf-8')))
+
+    async def encode_passwords_async(self, passwords: list[str]) -> list[bytes]:
+        encoded = [password.encode('utf-8') for password in passwords]
+        return await self._hashing('hash_many', self.hasher.hash_many(encoded))
+
+    async def _hashing(self, operation: str, call: Awaitable[T]) -> T:
+        """ Rejected calls are not observed, they would drag the latency down exactly when it is high """
+        started = time.perf_counter()
+        try:
+            result = await call
+        except HashingQueueFull:
+            raise self._overloaded()
+        PASSWORD_HASH_DURATION.labels(operation).observe(time.perf_counter() - started)
+        return result
+
+    @staticmethod
+    def _overloaded() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Too many authentication requests, try again later',
+            headers={'Retry-After': '1'},
+        )
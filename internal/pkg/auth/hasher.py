@@ -0,0 +1,112 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Literal, Sequence, TypeVar
+
+import bcrypt
+
+T = TypeVar("T")
+
+ExecutorKind = Literal['thread', 'process', 'inline']
+
+
+class HashingQueueFull(Exception):
+    pass
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _hashpw_many(passwords: list[bytes], rounds: int) -> list[bytes]:
+    return [bcrypt.hashpw(password, bcrypt.gensalt(rounds)) for password in passwords]
+
+
+def _checkpw(password: bytes, hashed_password: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed_password)
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """ Cost factor of a `$2b$<rounds>$...` hash """
+    return int(hashed_password.split(b'$')[2])
+
+
+class PasswordHasher:
+    """ Runs bcrypt off the event loop.
+
+    bcrypt releases the GIL, so a thread pool is enough for most deployments;
+    a process pool isolates hashing from the worker's interpreter completely.
+    `inline` runs on the event loop and exists for benchmarks/debugging only.
+
+    At most `max_workers + max_queue` calls may be in flight per worker process,
+    everything above that is rejected with `HashingQueueFull` instead of piling up.
+
+    `rounds` is the bcrypt cost of new hashes, `python -m internal.cli.bcrypt_cost` picks it for the hardware.
+    """
+
+    def __init__(
+            self,
+            executor: ExecutorKind = 'thread',
+            max_workers: int | None = None,
+            max_queue: int = 64,
+            rounds: int = 12,
+    ):
+        self.executor_kind = executor
+        self.rounds = rounds
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self._executor: Executor | None = None
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _get_executor(self) -> Executor | None:
+        if self._executor is None and self.executor_kind != 'inline':
+            if self.executor_kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bcrypt')
+        return self._executor
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        if self._in_flight >= self.capacity:
+            raise HashingQueueFull(f'{self._in_flight} hashing jobs are already in flight')
+
+        self._in_flight += 1
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+
+    async def hash(self, password: bytes) -> bytes:
+        return await self._run(_hashpw, password, self.rounds)
+
+    async def hash_many(self, passwords: Sequence[bytes], chunksize: int = 32) -> list[bytes]:
+        """ Bulk hashing spread over every pool worker, a chunk counts as one in-flight call """
+        chunks = [list(passwords[i:i + chunksize]) for i in range(0, len(passwords), chunksize)]
+        hashed = []
+        for start in range(0, len(chunks), self.max_workers):
+            window = chunks[start:start + self.max_workers]
+            for chunk in await asyncio.gather(*(self._run(_hashpw_many, chunk, self.rounds) for chunk in window)):
+                hashed.extend(chunk)
+        return hashed
+
+    async def check(self, password: bytes, hashed_password: bytes) -> bool:
+        return await self._run(_checkpw, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: bytes) -> bool:
+        return hash_rounds(hashed_password) != self.rounds
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
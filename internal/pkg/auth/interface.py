@@ -4,13 +4,17 @@ from typing import Protocol
 
 class Auth(Protocol):
     @abc.abstractmethod
-    def encode_token(self, user_id: int | str):
+    def encode_token(self, user_id: int | str, claims: dict | None = None):
         ...
 
     @abc.abstractmethod
     def decode_token(self, token: str) -> str:
         ...
 
+    @abc.abstractmethod
+    def decode_claims(self, token: str) -> dict:
+        ...
+
     @staticmethod
     @abc.abstractmethod
     def verify_password(plain_password: str, hashed_password: bytes) -> bool:
@@ -18,5 +22,21 @@ class Auth(Protocol):
 
     @staticmethod
     @abc.abstractmethod
-    def encode_password(password: str) -> bytes:
+    def encode_password(password: str, rounds: int = 12) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def needs_rehash(self, hashed_password: bytes) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def verify_password_async(self, plain_password: str, hashed_password: bytes) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def encode_password_async(self, password: str) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    async def encode_passwords_async(self, passwords: list[str]) -> list[bytes]:
         ...
@@ -0,0 +1,88 @@
+import hashlib
+import secrets
+import time
+
+from fastapi import HTTPException
+from starlette import status
+
+from internal.pkg.cache.interface import Cache
+
+
+class RefreshSessionStore:
+    """ Single-use refresh tokens with their sessions kept in the cache (Redis).
+
+    A token is `<user_id>.<random>`, the cache only holds a digest of it. `rotate` consumes the
+    presented token and issues the next one; presenting a consumed token again means it leaked,
+    so every session of that user is revoked. Sessions are bound to the client `fingerprint`
+    given at sign-in. Each call is at most two pipelined round trips.
+    """
+
+    def __init__(self, cache: Cache, ttl: float = 30 * 24 * 3600, prefix: str = 'refresh:'):
+        self.cache = cache
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @staticmethod
+    def _digest(value: str) -> str:
+        return hashlib.blake2b(value.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _key(self, user_id: int, token: str) -> str:
+        return f'{self.prefix}{user_id}:{self._digest(token)}'
+
+    def _revoked_key(self, user_id: int) -> str:
+        return f'{self.prefix}{user_id}:revoked_before'
+
+    @staticmethod
+    def _invalid(detail: str = 'Refresh token is invalid or expired') -> HTTPException:
+        return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+    def _user_id(self, token: str) -> int:
+        user_id, _, _ = token.partition('.')
+        if not user_id.isdigit():
+            raise self._invalid()
+        return int(user_id)
+
+    def _session(self, user_id: int, fingerprint: str | None, ip: str | None) -> tuple[str, dict]:
+        token = f'{user_id}.{secrets.token_urlsafe(32)}'
+        session = {
+            'user_id': user_id,
+            'fingerprint': self._digest(fingerprint) if fingerprint else None,
+            'ip': ip,
+            'created_at': time.time(),
+        }
+        return token, session
+
+    async def create(self, user_id: int, fingerprint: str | None = None, ip: str | None = None) -> str:
+        token, session = self._session(user_id, fingerprint, ip)
+        await self.cache.set(self._key(user_id, token), session, self.ttl)
+        return token
+
+    async def rotate(self, token: str, fingerprint: str | None = None, ip: str | None = None) -> tuple[int, str]:
+        """ :return: the session's user id and the refresh token replacing `token` """
+        user_id = self._user_id(token)
+        key = self._key(user_id, token)
+        async with self.cache.pipeline() as pipe:
+            pipe.get(key).remove_key(key).get(f'{key}:used').get(self._revoked_key(user_id))
+        session, removed, used, revoked_before = pipe.results
+
+        if used or (session is not None and not removed):
+            # Replayed, or raced by a concurrent refresh with the same token
+            await self.revoke_all(user_id)
+            raise self._invalid('Refresh token was already used, all sessions are revoked')
+        if session is None or (revoked_before is not None and session['created_at'] <= revoked_before):
+            raise self._invalid()
+        if session['fingerprint'] is not None and session['fingerprint'] != self._digest(fingerprint or ''):
+            raise self._invalid('Refresh token belongs to another client')
+
+        new_token, new_session = self._session(user_id, fingerprint, ip)
+        async with self.cache.pipeline() as pipe:
+            pipe.set(self._key(user_id, new_token), new_session, self.ttl).set(f'{key}:used', True, self.ttl)
+        return user_id, new_token
+
+    async def revoke(self, token: str) -> bool:
+        user_id = self._user_id(token)
+        return bool(await self.cache.remove_key(self._key(user_id, token)))
+
+    async def revoke_all(self, user_id: int) -> None:
+        """ Every session of the user issued until now stops being refreshable """
+        await self.cache.set(self._revoked_key(user_id), time.time(), self.ttl)
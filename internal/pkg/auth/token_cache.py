@@ -0,0 +1,44 @@
+import hashlib
+import time
+
+from internal.pkg.cache.lru import LRUCache
+
+
+class TokenCache:
+    """ Bounded LRUs of already verified tokens, keyed by a digest of the token.
+
+    Valid tokens are kept until their `exp`, rejected ones for `negative_ttl` seconds in a separate,
+    smaller LRU, so a flood of garbage tokens can't evict the valid ones.
+    """
+
+    def __init__(self, maxsize: int = 10_000, negative_ttl: float = 5.0, negative_maxsize: int = 1_000):
+        self.negative_ttl = negative_ttl
+        self._lru = LRUCache(maxsize=maxsize, clock=time.time)
+        self._rejected = LRUCache(maxsize=negative_maxsize, clock=time.time)
+
+    @property
+    def stats(self):
+        return self._lru.stats
+
+    @property
+    def negative_stats(self):
+        return self._rejected.stats
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key: bytes) -> tuple[bool, dict | str] | None:
+        """ :return: (True, claims) for a valid token, (False, error) for a rejected one """
+        if (claims := self._lru.get(key)) is not None:
+            return True, claims
+        if (error := self._rejected.get(key)) is not None:
+            return False, error
+        return None
+
+    def accept(self, key: bytes, claims: dict, expires_at: float) -> None:
+        if (ttl := expires_at - time.time()) > 0:
+            self._lru.set(key, claims, ttl)
+
+    def reject(self, key: bytes, error: str) -> None:
+        self._rejected.set(key, error, self.negative_ttl)
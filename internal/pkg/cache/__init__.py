@@ -1,4 +1,14 @@
+from .bloom import BloomFilter, ExistenceFilter
+from .codecs import CacheSerializer, get_codec
 from .interface import Cache
+from .keys import CacheKeys, KeyFamily
+from .loader import CacheLoader
+from .lru import CacheStats, LRUCache
+from .pipeline import CachePipeline, SequentialPipeline
 from .redis_ import RedisCache
+from .tiered import TieredCache
 
-__all__ = ['Cache', 'RedisCache']
+__all__ = [
+    'BloomFilter', 'Cache', 'CacheKeys', 'CacheLoader', 'CachePipeline', 'CacheSerializer', 'CacheStats',
+    'ExistenceFilter', 'KeyFamily', 'LRUCache', 'RedisCache', 'SequentialPipeline', 'TieredCache', 'get_codec',
+]
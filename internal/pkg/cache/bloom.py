@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import logging
+import math
+from typing import Any, Awaitable, Callable, Iterable, Sequence
+
+logger = logging.getLogger(__name__)
+
+Page = Callable[[Sequence | None, int], Awaitable[list[Any]]]
+
+
+class BloomFilter:
+    """ Set membership with false positives only: `value in bloom` is False means it was never added """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str) -> Iterable[int]:
+        # Double hashing: k positions out of two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class ExistenceFilter:
+    """ Per-process bloom filters of some columns of a table, e.g. which usernames may be taken.
+
+    Built by paging through the table by primary key, then every `refresh_interval` seconds
+    only the rows added since are read. Rows changed in place or in other processes show up
+    through `add` or not at all: a negative answer is a hint, the database stays the authority.
+    Until the first build is done `ready` is False and nothing should be concluded from the filter.
+    """
+
+    def __init__(
+            self,
+            page: Page,
+            columns: Sequence[str],
+            capacity: int = 1_000_000,
+            error_rate: float = 0.01,
+            refresh_interval: float = 30.0,
+            batch_size: int = 10_000,
+    ):
+        """ :param page: `page(after_id, limit)` rows with the primary key above `after_id`, ordered by it """
+        self.page = page
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.filters = {column: BloomFilter(capacity, error_rate) for column in self.columns}
+        self.ready = False
+        self._last_id: int | None = None
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def add(self, entry: Any) -> None:
+        for column in self.columns:
+            if (value := getattr(entry, column, None)) is not None:
+                self.filters[column].add(value)
+
+    def might_contain(self, column: str, value: str) -> bool:
+        return not self.ready or value in self.filters[column]
+
+    async def refresh(self) -> int:
+        """ :return: number of rows added to the filters """
+        async with self._lock:
+            if any(bloom.count > bloom.capacity for bloom in self.filters.values()):
+                # Over capacity the false positive rate climbs, start over with room for twice as many
+                self.capacity *= 2
+                self.filters = {column: BloomFilter(self.capacity, self.error_rate) for column in self.columns}
+                self._last_id, self.ready = None, False
+
+            added = 0
+            while rows := await self.page((self._last_id,) if self._last_id is not None else None, self.batch_size):
+                for row in rows:
+                    self.add(row)
+                self._last_id = rows[-1].id
+                added += len(rows)
+                if len(rows) < self.batch_size:
+                    break
+            self.ready = True
+            return added
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception('Refreshing the existence filter failed')
+            await asyncio.sleep(self.refresh_interval)
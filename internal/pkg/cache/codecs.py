@@ -0,0 +1,125 @@
+import json
+import zlib
+from typing import Protocol
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+# 0xC1 is never produced by msgpack and can't start a JSON document
+MAGIC = b'\xc1'
+ENVELOPE_VERSION = 1
+HEADER_SIZE = 4
+
+FLAG_ZLIB = 0x01
+# Payload is the caller's bytes as is, no codec involved
+FLAG_RAW = 0x02
+RAW_CODEC_ID = 0
+
+
+class Codec(Protocol):
+    id: int
+    name: str
+
+    def dumps(self, value: any) -> bytes:
+        ...
+
+    def loads(self, raw: bytes) -> any:
+        ...
+
+
+class JsonCodec:
+    id = 1
+    name = 'json'
+
+    def dumps(self, value: any) -> bytes:
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, raw: bytes) -> any:
+        return json.loads(raw)
+
+
+class OrjsonCodec:
+    id = 2
+    name = 'orjson'
+
+    def dumps(self, value: any) -> bytes:
+        return orjson.dumps(value)
+
+    def loads(self, raw: bytes) -> any:
+        return orjson.loads(raw)
+
+
+class MsgpackCodec:
+    id = 3
+    name = 'msgpack'
+
+    def dumps(self, value: any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, raw: bytes) -> any:
+        return msgpack.unpackb(raw, raw=False)
+
+
+def available_codecs() -> dict[str, Codec]:
+    codecs = [JsonCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    if msgpack is not None:
+        codecs.append(MsgpackCodec())
+    return {codec.name: codec for codec in codecs}
+
+
+def get_codec(name: str) -> Codec:
+    codecs = available_codecs()
+    if name not in codecs:
+        raise ValueError(f'Cache codec {name!r} is not available, installed: {", ".join(codecs)}')
+    return codecs[name]
+
+
+class CacheSerializer:
+    """ Encodes values as `MAGIC | version | codec id | flags | payload`.
+
+    Values written by any installed codec can be read back, so the codec may be changed
+    without flushing Redis. Values without the header are pre-envelope plain JSON.
+    `bytes` values skip the codec and are returned as the same bytes.
+    """
+
+    def __init__(self, codec: Codec | str = 'json', compress_threshold: int | None = 1024, compress_level: int = 1):
+        self.codec = get_codec(codec) if isinstance(codec, str) else codec
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self._codecs = {codec.id: codec for codec in available_codecs().values()}
+        self._codecs[self.codec.id] = self.codec
+
+    def dumps(self, value: any) -> bytes:
+        if isinstance(value, bytes):
+            payload, codec_id, flags = value, RAW_CODEC_ID, FLAG_RAW
+        else:
+            payload, codec_id, flags = self.codec.dumps(value), self.codec.id, 0
+        if self.compress_threshold is not None and len(payload) > self.compress_threshold:
+            payload, flags = zlib.compress(payload, self.compress_level), flags | FLAG_ZLIB
+        return MAGIC + bytes((ENVELOPE_VERSION, codec_id, flags)) + payload
+
+    def loads(self, raw: bytes) -> any:
+        if not raw.startswith(MAGIC):
+            return json.loads(raw)
+
+        version, codec_id, flags = raw[1:HEADER_SIZE]
+        if version != ENVELOPE_VERSION:
+            raise ValueError(f'Unknown cache envelope version {version}')
+        if not flags & FLAG_RAW and (codec := self._codecs.get(codec_id)) is None:
+            raise ValueError(f'Cache value was written by codec #{codec_id}, which is not installed')
+
+        payload = raw[HEADER_SIZE:]
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        if flags & FLAG_RAW:
+            return payload
+        return codec.loads(payload)
@@ -1,8 +1,19 @@
 import abc
-from typing import Protocol
+from typing import AsyncContextManager, Protocol
+
+from internal.pkg.cache.pipeline import CachePipeline
 
 
 class Cache(Protocol):
+    async def startup(self) -> None:
+        """ Start background tasks, called once per worker """
+
+    async def shutdown(self) -> None:
+        ...
+
+    async def warm_up(self, connections: int = 1) -> None:
+        """ Open up to `connections` pooled connections before the first request needs them """
+
     @abc.abstractmethod
     async def ping(self) -> bool:
         ...
@@ -11,10 +22,30 @@ class Cache(Protocol):
     async def set(self, key: str, value: any, expires: float) -> bool:
         ...
 
+    @abc.abstractmethod
+    async def add(self, key: str, value: any, expires: float) -> bool:
+        """ Set the key only if it doesn't exist yet """
+
     @abc.abstractmethod
     async def get(self, key: str) -> any:
         ...
 
+    @abc.abstractmethod
+    async def get_many(self, keys: list[str]) -> list[any]:
+        """ Values in the order of `keys`, None for missing ones """
+
+    @abc.abstractmethod
+    async def set_many(self, mapping: dict[str, any], expires: float) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def delete_many(self, keys: list[str]) -> int:
+        """ :return: number of removed keys """
+
+    @abc.abstractmethod
+    def pipeline(self, transaction: bool = False) -> AsyncContextManager[CachePipeline]:
+        """ Batch commands into a single round trip, `transaction=True` runs them atomically (MULTI/EXEC) """
+
     @abc.abstractmethod
     async def flash_all(self) -> bool:
         ...
@@ -22,3 +53,23 @@ class Cache(Protocol):
     @abc.abstractmethod
     async def remove_key(self, key: str) -> bool:
         ...
+
+    async def replace(self, key: str, expected: any, value: any, expires: float) -> bool:
+        """ Compare-and-set: write `value` (None removes the key) only while `key` still holds `expected`.
+
+        Not atomic here, shared backends override it.
+        """
+        if await self.get(key) != expected:
+            return False
+        if value is None:
+            await self.remove_key(key)
+        else:
+            await self.set(key, value, expires)
+        return True
+
+    async def acquire_lease(self, key: str, owner: str, expires: float) -> bool:
+        return await self.add(key, owner, expires)
+
+    async def release_lease(self, key: str, owner: str) -> bool:
+        """ Removes the lease only if `owner` still holds it, it may have expired and been taken since """
+        return await self.replace(key, owner, None, 0)
@@ -0,0 +1,67 @@
+import time
+from typing import Callable, Sequence
+
+from internal.pkg.cache.interface import Cache
+
+
+class KeyFamily:
+    """ Keys of one kind of entry, `<namespace>:<name>:v<version>:<generations>:<template>`.
+
+    Bump `version` when the cached representation changes: old entries are left to expire
+    under keys nobody reads any more. Every family carries a generation of its own name and
+    of each of its `tags`, see `CacheKeys.invalidate`.
+    """
+
+    def __init__(self, name: str, template: str, version: int = 1, tags: Sequence[str] = ()):
+        self.name = name
+        self.template = template
+        self.version = version
+        self.tags = (name, *tags)
+
+
+class CacheKeys:
+    """ Resolves key families to keys of the current generation.
+
+    A generation is a shared cache entry per tag holding the time of the last invalidation,
+    so dropping every entry of a family or tag is a single write instead of a FLUSHALL or a
+    SCAN over the keys. Resolving costs one `get_many`, an L1 hit behind `TieredCache`.
+    A lost generation is recreated with a new value, which can only invalidate entries.
+    """
+
+    def __init__(self, cache: Cache, namespace: str = 'sidus', generation_ttl: float = 30 * 24 * 3600):
+        """ :param generation_ttl: must be well above the TTL of any entry built from the generations """
+        self.cache = cache
+        self.namespace = namespace
+        self.generation_ttl = generation_ttl
+
+    def key(self, name: str) -> str:
+        """ Namespaced key outside of any family, e.g. for entries that must survive invalidations """
+        return f'{self.namespace}:{name}'
+
+    def _generation_key(self, tag: str) -> str:
+        return f'{self.namespace}:gen:{tag}'
+
+    async def generations(self, tags: Sequence[str]) -> list[int]:
+        keys = [self._generation_key(tag) for tag in tags]
+        generations = await self.cache.get_many(keys)
+        for i, generation in enumerate(generations):
+            if generation is None:
+                fresh = time.time_ns()
+                generations[i] = fresh if await self.cache.add(keys[i], fresh, self.generation_ttl) \
+                    else await self.cache.get(keys[i])
+        return generations
+
+    async def bind(self, family: KeyFamily) -> Callable[..., str]:
+        """ :return: `build(**params)` giving keys of `family` in the current generation """
+        generation = '.'.join(format(value, 'x') for value in await self.generations(family.tags))
+        prefix = f'{self.namespace}:{family.name}:v{family.version}:{generation}:'
+
+        def build(**params) -> str:
+            return prefix + family.template.format(**params)
+
+        return build
+
+    async def invalidate(self, *tags: str) -> None:
+        """ Every entry of a family named or tagged with one of `tags` is gone, in one write """
+        fresh = time.time_ns()
+        await self.cache.set_many({self._generation_key(tag): fresh for tag in tags}, self.generation_ttl)
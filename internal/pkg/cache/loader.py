@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import math
+import random
+import struct
+import time
+import uuid
+from typing import Awaitable, Callable, TypeVar
+
+from internal.pkg.cache.interface import Cache
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+Loader = Callable[[], Awaitable[T | None]]
+ManyLoader = Callable[[list[str]], Awaitable[dict[str, T]]]
+
+# `bytes` values are stored as `BYTES_ENVELOPE | expires_at | load_seconds | value`,
+# so a hit hands back the stored bytes without decoding them
+BYTES_ENVELOPE = b'\x00env1'
+_BYTES_HEADER = struct.Struct('!dd')
+# Stored for keys the loader found nothing for
+TOMBSTONE = b'\x00tomb'
+
+
+class CacheLoader:
+    """ Cache-aside with stampede protection.
+
+    * concurrent misses for a key inside one worker share a single load (single-flight);
+    * across workers only the holder of the `<key>:lease` key loads, others poll the cache;
+      a lease is only ever released by its owner;
+    * values are stored as `{"v": value, "x": expires_at, "d": load_seconds}` and kept in the cache
+      for `stale_ttl` seconds past `expires_at`: a stale value is served while one request refreshes it,
+      the refresh only replaces the value it started from, so it never undoes an invalidation;
+    * fresh values are refreshed early with probability growing towards `expires_at` (XFetch, `beta`);
+    * `bytes` values (e.g. pre-encoded response bodies) use a binary envelope and are never decoded;
+    * with `negative_ttl` a key the loader found nothing for gets a tombstone, and is answered
+      with None without calling the loader until it expires or the key is removed.
+    """
+
+    def __init__(
+            self,
+            cache: Cache,
+            lease_ttl: float = 5.0,
+            lease_timeout: float = 2.0,
+            poll_interval: float = 0.02,
+            stale_ttl: float = 60.0,
+            beta: float = 1.0,
+    ):
+        self.cache = cache
+        self.lease_ttl = lease_ttl
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self.stale_ttl = stale_ttl
+        self.beta = beta
+        self.node_id = uuid.uuid4().hex
+        # Loads somebody waits for, and background refreshes nobody waits for
+        self._flights: dict[str, asyncio.Task] = {}
+        self._refreshes: dict[str, asyncio.Task] = {}
+
+    async def get_or_load(self, key: str, loader: Loader, ttl: float, negative_ttl: float | None = None) -> T | None:
+        """ :param ttl: seconds the loaded value is considered fresh
+        :param negative_ttl: seconds a miss of the loader is remembered
+        """
+        if (value := await self.cache.get(key)) == TOMBSTONE:
+            return None
+        if (envelope := self._unwrap(value)) is not None:
+            if not self._should_refresh(envelope):
+                return envelope['v']
+            if key not in self._refreshes and key not in self._flights:
+                self._start_flight(self._refreshes, key, self._refresh(key, value, loader, ttl, negative_ttl))
+            return envelope['v']
+
+        if (flight := self._flights.get(key)) is None:
+            flight = self._start_flight(self._flights, key, self._fill(key, loader, ttl, negative_ttl))
+        # One impatient client must not cancel the load for everybody else
+        return await asyncio.shield(flight)
+
+    async def get_many_or_load(
+            self, keys: list[str], loader: ManyLoader, ttl: float, negative_ttl: float | None = None,
+    ) -> dict[str, T]:
+        """ Multi-key variant: one cache round trip, one `loader(missing_keys)` call for all misses.
+
+        Expired values are reloaded with the rest of the misses; batches are not coalesced or leased.
+        """
+        keys = list(dict.fromkeys(keys))
+        found, missing = {}, []
+        now = time.time()
+        for key, value in zip(keys, await self.cache.get_many(keys)):
+            if value == TOMBSTONE:
+                continue
+            if (envelope := self._unwrap(value)) is not None and now < envelope['x']:
+                found[key] = envelope['v']
+            else:
+                missing.append(key)
+
+        if missing:
+            started = time.monotonic()
+            if loaded := await loader(missing):
+                delta = time.monotonic() - started
+                expires_at = time.time() + ttl
+                await self.cache.set_many(
+                    {key: self._wrap(value, expires_at, delta) for key, value in loaded.items()},
+                    ttl + self.stale_ttl,
+                )
+                found.update(loaded)
+            if negative_ttl and (absent := [key for key in missing if key not in found]):
+                await self.cache.set_many(dict.fromkeys(absent, TOMBSTONE), negative_ttl)
+        return found
+
+    @staticmethod
+    def _start_flight(flights: dict[str, asyncio.Task], key: str, coro: Awaitable) -> asyncio.Task:
+        flight = asyncio.create_task(coro)
+        flights[key] = flight
+        flight.add_done_callback(lambda _: flights.pop(key, None))
+        return flight
+
+    def _should_refresh(self, envelope: dict) -> bool:
+        now = time.time()
+        if now >= envelope['x']:
+            return True
+        return now - envelope['d'] * self.beta * math.log(1.0 - random.random()) >= envelope['x']
+
+    async def _fill(self, key: str, loader: Loader, ttl: float, negative_ttl: float | None = None) -> T | None:
+        lease_key = f'{key}:lease'
+        deadline = time.monotonic() + self.lease_timeout
+        while not (leased := await self.cache.acquire_lease(lease_key, self.node_id, self.lease_ttl)):
+            await asyncio.sleep(self.poll_interval)
+            if (value := await self.cache.get(key)) == TOMBSTONE:
+                return None
+            if (envelope := self._unwrap(value)) is not None:
+                return envelope['v']
+            if time.monotonic() >= deadline:
+                # The lease holder is too slow or died, don't make our client wait for it
+                break
+        try:
+            return await self._load(key, loader, ttl, negative_ttl)
+        finally:
+            if leased:
+                await self.cache.release_lease(lease_key, self.node_id)
+
+    async def _refresh(self, key: str, current: any, loader: Loader, ttl: float, negative_ttl: float | None) -> None:
+        """ :param current: the stored value being refreshed, anything else in its place is newer than the load """
+        lease_key = f'{key}:lease'
+        if not await self.cache.acquire_lease(lease_key, self.node_id, self.lease_ttl):
+            return
+        try:
+            started = time.monotonic()
+            value = await loader()
+            if value is not None:
+                envelope = self._wrap(value, time.time() + ttl, time.monotonic() - started)
+                await self.cache.replace(key, current, envelope, ttl + self.stale_ttl)
+            else:
+                # Gone from the source: drop the stale value rather than keep serving it
+                await self.cache.replace(key, current, TOMBSTONE if negative_ttl else None, negative_ttl or 0)
+        except Exception:
+            logger.exception("Background refresh of %s failed", key)
+        finally:
+            await self.cache.release_lease(lease_key, self.node_id)
+
+    async def _load(self, key: str, loader: Loader, ttl: float, negative_ttl: float | None = None) -> T | None:
+        started = time.monotonic()
+        value = await loader()
+        if value is not None:
+            envelope = self._wrap(value, time.time() + ttl, time.monotonic() - started)
+            await self.cache.set(key, envelope, ttl + self.stale_ttl)
+        elif negative_ttl:
+            await self.cache.set(key, TOMBSTONE, negative_ttl)
+        return value
+
+    @staticmethod
+    def _wrap(value: T, expires_at: float, delta: float) -> dict | bytes:
+        if isinstance(value, bytes):
+            return BYTES_ENVELOPE + _BYTES_HEADER.pack(expires_at, delta) + value
+        return {'v': value, 'x': expires_at, 'd': delta}
+
+    @staticmethod
+    def _unwrap(value: any) -> dict | None:
+        if isinstance(value, bytes) and value.startswith(BYTES_ENVELOPE):
+            offset = len(BYTES_ENVELOPE)
+            expires_at, delta = _BYTES_HEADER.unpack_from(value, offset)
+            return {'v': value[offset + _BYTES_HEADER.size:], 'x': expires_at, 'd': delta}
+        if isinstance(value, dict) and value.keys() == {'v', 'x', 'd'}:
+            return value
+        return None
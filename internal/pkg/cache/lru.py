@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Callable, Hashable
+
+MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def dict(self) -> dict:
+        return asdict(self)
+
+
+class LRUCache:
+    """ Bounded in-process LRU with per-entry expiry.
+
+    Not a `Cache` implementation: it is synchronous and never leaves the process.
+    `maxsize=0` disables storing anything.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._clock = clock
+        self._data: OrderedDict[Hashable, tuple[any, float | None]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, MISSING, count=False) is not MISSING
+
+    def get(self, key: Hashable, default: any = None, count: bool = True) -> any:
+        entry = self._data.get(key, MISSING)
+        if entry is not MISSING:
+            value, expires_at = entry
+            if expires_at is None or expires_at > self._clock():
+                self._data.move_to_end(key)
+                if count:
+                    self.stats.hits += 1
+                return value
+            del self._data[key]
+        if count:
+            self.stats.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: any, ttl: float | None = None) -> None:
+        """ :param ttl: seconds, capped by the cache-wide ttl """
+        if self.maxsize <= 0:
+            return
+        if self.ttl is not None:
+            ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (value, None if ttl is None else self._clock() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+
+    def pop(self, key: Hashable) -> bool:
+        return self._data.pop(key, MISSING) is not MISSING
+
+    def clear(self) -> None:
+        self._data.clear()
@@ -0,0 +1,115 @@
+import abc
+from typing import TYPE_CHECKING, Awaitable, Callable, Protocol
+
+from internal.pkg.metrics import CACHE_OPERATION_DURATION
+
+if TYPE_CHECKING:
+    from internal.pkg.cache.codecs import CacheSerializer
+    from internal.pkg.cache.interface import Cache
+
+
+def expires_ms(expires: float) -> int:
+    """ Redis takes integer expiries, `Cache` ones are float seconds """
+    return max(1, int(expires * 1000))
+
+
+class CachePipeline(Protocol):
+    """ Commands queued inside `async with cache.pipeline() as pipe:` are sent when the block exits;
+    `pipe.results` then holds their results in order.
+    """
+    results: list[any]
+
+    @abc.abstractmethod
+    def set(self, key: str, value: any, expires: float) -> 'CachePipeline':
+        ...
+
+    @abc.abstractmethod
+    def get(self, key: str) -> 'CachePipeline':
+        ...
+
+    @abc.abstractmethod
+    def remove_key(self, key: str) -> 'CachePipeline':
+        ...
+
+    @abc.abstractmethod
+    async def execute(self) -> list[any]:
+        ...
+
+    async def __aenter__(self) -> 'CachePipeline':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.execute()
+
+
+class RedisPipeline(CachePipeline):
+    def __init__(self, pipe, serializer: 'CacheSerializer'):
+        self.results = []
+        self._pipe = pipe
+        self._serializer = serializer
+        self._decoders: list[Callable[[any], any] | None] = []
+
+    def _queued(self, decoder: Callable[[any], any] | None) -> 'RedisPipeline':
+        self._decoders.append(decoder)
+        return self
+
+    def set(self, key: str, value: any, expires: float) -> 'RedisPipeline':
+        self._pipe.set(key, self._serializer.dumps(value), px=expires_ms(expires))
+        return self._queued(bool)
+
+    def get(self, key: str) -> 'RedisPipeline':
+        self._pipe.get(key)
+        return self._queued(lambda raw: self._serializer.loads(raw) if raw else None)
+
+    def remove_key(self, key: str) -> 'RedisPipeline':
+        self._pipe.delete(key)
+        return self._queued(bool)
+
+    def publish(self, channel: str, message: str) -> 'RedisPipeline':
+        """ Not part of `CachePipeline`, its result is left out of `results` """
+        self._pipe.publish(channel, message)
+        return self._queued(None)
+
+    async def execute(self) -> list[any]:
+        if not self._decoders:
+            # Already executed, e.g. by `TieredCache.pipeline` before `__aexit__`: nothing to send or time
+            self.results = []
+            return self.results
+        with CACHE_OPERATION_DURATION.labels('pipeline').time():
+            raw = await self._pipe.execute()
+        self.results = [decode(res) for decode, res in zip(self._decoders, raw) if decode is not None]
+        self._decoders = []
+        return self.results
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            await super().__aexit__(exc_type, exc, tb)
+        finally:
+            await self._pipe.reset()
+
+
+class SequentialPipeline(CachePipeline):
+    """ Runs the queued commands one by one, for `Cache` implementations without native pipelining """
+
+    def __init__(self, cache: 'Cache'):
+        self.results = []
+        self._cache = cache
+        self._commands: list[Callable[[], Awaitable[any]]] = []
+
+    def set(self, key: str, value: any, expires: float) -> 'SequentialPipeline':
+        self._commands.append(lambda: self._cache.set(key, value, expires))
+        return self
+
+    def get(self, key: str) -> 'SequentialPipeline':
+        self._commands.append(lambda: self._cache.get(key))
+        return self
+
+    def remove_key(self, key: str) -> 'SequentialPipeline':
+        self._commands.append(lambda: self._cache.remove_key(key))
+        return self
+
+    async def execute(self) -> list[any]:
+        commands, self._commands = self._commands, []
+        self.results = [await command() for command in commands]
+        return self.results
@@ -1,16 +1,81 @@
-import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
+from internal.pkg.cache.codecs import CacheSerializer
 from internal.pkg.cache.interface import Cache
+from internal.pkg.cache.pipeline import RedisPipeline, expires_ms
+from internal.pkg.metrics import CACHE_OPERATION_DURATION, CACHE_REQUESTS
 from redis import asyncio as aioredis
+from redis.asyncio.client import PubSub
+
+_HITS = CACHE_REQUESTS.labels('redis', 'hit')
+_MISSES = CACHE_REQUESTS.labels('redis', 'miss')
+
+# KEYS[1] = key, ARGV = expected[, value, expires_ms]; without a value the key is removed
+REPLACE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if #ARGV == 1 then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+end
+return 1
+"""
 
 
 class RedisCache(Cache):
-    def __init__(self, host: str = 'localhost', port: int = 6379):
-        self.redis = aioredis.Redis(host=host, port=port, socket_connect_timeout=5)
+    def __init__(
+            self,
+            host: str = 'localhost',
+            port: int = 6379,
+            codec: str = 'json',
+            compress_threshold: int | None = 1024,
+            max_connections: int = 50,
+            pool_timeout: float | None = 5,
+            socket_timeout: float | None = 5,
+            socket_connect_timeout: float | None = 5,
+            socket_keepalive: bool = True,
+            health_check_interval: float = 30,
+    ):
+        """ Connection pool is per process, i.e. per gunicorn worker.
+
+        :param max_connections: pool size, callers wait up to `pool_timeout` seconds for a free connection
+        :param socket_timeout: per command
+        :param health_check_interval: PING connections idle for longer than this before use
+        """
+        self._connection_kwargs = dict(
+            host=host,
+            port=port,
+            socket_connect_timeout=socket_connect_timeout,
+            socket_keepalive=socket_keepalive,
+            health_check_interval=health_check_interval,
+        )
+        self.redis = aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool(
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            socket_timeout=socket_timeout,
+            **self._connection_kwargs,
+        ))
+        self.serializer = CacheSerializer(codec, compress_threshold=compress_threshold)
+        self._pubsub_redis: aioredis.Redis | None = None
+        self._replace = self.redis.register_script(REPLACE_SCRIPT)
+
+    def dumps(self, value: any) -> bytes:
+        return self.serializer.dumps(value)
+
+    def loads(self, raw: bytes) -> any:
+        return self.serializer.loads(raw)
 
     async def ping(self) -> bool:
         return await self.redis.ping()
 
+    async def warm_up(self, connections: int = 1) -> None:
+        # Concurrent commands each check out their own connection
+        await asyncio.gather(*(self.redis.ping() for _ in range(connections)))
+
     async def set(self, key: str, value: any, expires: float) -> bool:
         """ Set cache <key=value>
 
@@ -19,18 +84,78 @@ class RedisCache(Cache):
         :param expires: key retention time at seconds
         :return: ...
         """
-        return await self.redis.set(key, json.dumps(value), ex=expires)
+        raw = self.dumps(value)
+        with CACHE_OPERATION_DURATION.labels('set').time():
+            return await self.redis.set(key, raw, px=expires_ms(expires))
+
+    async def add(self, key: str, value: any, expires: float) -> bool:
+        raw = self.dumps(value)
+        with CACHE_OPERATION_DURATION.labels('add').time():
+            return bool(await self.redis.set(key, raw, px=expires_ms(expires), nx=True))
 
     async def get(self, key: str) -> any:
-        if res := await self.redis.get(key):
-            return json.loads(res)
+        with CACHE_OPERATION_DURATION.labels('get').time():
+            res = await self.redis.get(key)
+        if res:
+            _HITS.inc()
+            return self.loads(res)
+        _MISSES.inc()
         return res
 
+    async def get_many(self, keys: list[str]) -> list[any]:
+        if not keys:
+            return []
+        with CACHE_OPERATION_DURATION.labels('get_many').time():
+            raw = await self.redis.mget(keys)
+        hits = sum(1 for res in raw if res)
+        _HITS.inc(hits)
+        _MISSES.inc(len(raw) - hits)
+        return [self.loads(res) if res else None for res in raw]
+
+    async def set_many(self, mapping: dict[str, any], expires: float) -> bool:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, self.dumps(value), px=expires_ms(expires))
+            with CACHE_OPERATION_DURATION.labels('set_many').time():
+                return all(await pipe.execute())
+
+    async def replace(self, key: str, expected: any, value: any, expires: float) -> bool:
+        """ Atomic, `expected` is compared as serialized bytes """
+        args = [self.dumps(expected)]
+        if value is not None:
+            args += [self.dumps(value), expires_ms(expires)]
+        with CACHE_OPERATION_DURATION.labels('replace').time():
+            return bool(await self._replace(keys=[key], args=args))
+
     async def remove_key(self, key: str) -> bool:
-        return await self.redis.delete(key)
+        with CACHE_OPERATION_DURATION.labels('delete').time():
+            return await self.redis.delete(key)
+
+    async def delete_many(self, keys: list[str]) -> int:
+        if not keys:
+            return 0
+        with CACHE_OPERATION_DURATION.labels('delete_many').time():
+            return await self.redis.delete(*keys)
+
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = False) -> AsyncIterator[RedisPipeline]:
+        async with RedisPipeline(self.redis.pipeline(transaction=transaction), self.serializer) as pipe:
+            yield pipe
+
+    def pubsub(self, **kwargs) -> PubSub:
+        """ PubSub on its own connection without `socket_timeout`, which would break idle subscriptions """
+        if self._pubsub_redis is None:
+            self._pubsub_redis = aioredis.Redis(**self._connection_kwargs)
+        return self._pubsub_redis.pubsub(**kwargs)
+
+    async def shutdown(self) -> None:
+        await self.redis.close()
+        if self._pubsub_redis is not None:
+            await self._pubsub_redis.close()
 
     async def flash_all(self) -> bool:
-        """ Clear all keys in cache storage.
+        """ Clear all keys in cache storage, including those of other services sharing the Redis.
+        `CacheKeys.invalidate` drops a family of keys without that.
 
         :rtype: ...
         """
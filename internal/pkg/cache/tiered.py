@@ -0,0 +1,230 @@
+import asyncio
+import copy
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
+from internal.pkg.cache.interface import Cache
+from internal.pkg.cache.lru import MISSING, CacheStats, LRUCache
+from internal.pkg.cache.pipeline import CachePipeline, RedisPipeline
+from internal.pkg.cache.redis_ import RedisCache
+from internal.pkg.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+FLUSH_ALL = '*'
+# Seconds before the invalidation listener subscribes again after an error
+RESUBSCRIBE_DELAY = 1.0
+
+_L1_HITS = CACHE_REQUESTS.labels('l1', 'hit')
+_L1_MISSES = CACHE_REQUESTS.labels('l1', 'miss')
+_IMMUTABLE = (bytes, str, int, float, bool, type(None))
+
+
+def _detached(value: any) -> any:
+    """ L1 keeps its own copy, so callers mutating a returned dict/list don't change the cached value """
+    return value if isinstance(value, _IMMUTABLE) else copy.deepcopy(value)
+
+
+class TieredCache(Cache):
+    """ In-process LRU (L1) in front of Redis (L2).
+
+    Every write/removal is published to `channel`, other workers and nodes drop the key
+    from their L1. L1 ttl bounds staleness if a message is lost; after a pub/sub
+    reconnect the whole L1 is dropped. L1 hands out copies of mutable values.
+    """
+
+    def __init__(
+            self,
+            remote: RedisCache,
+            maxsize: int = 4096,
+            ttl: float = 5.0,
+            channel: str = 'cache:invalidate',
+    ):
+        self.remote = remote
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.remote_stats = CacheStats()
+        self.channel = channel
+        self.node_id = uuid.uuid4().hex
+        self._invalidations = 0
+        self._listener: asyncio.Task | None = None
+
+    async def startup(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def shutdown(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await self.remote.shutdown()
+
+    async def ping(self) -> bool:
+        return await self.remote.ping()
+
+    async def warm_up(self, connections: int = 1) -> None:
+        await self.remote.warm_up(connections)
+
+    async def set(self, key: str, value: any, expires: float) -> bool:
+        async with self.pipeline() as pipe:
+            pipe.set(key, value, expires)
+        return pipe.results[0]
+
+    async def add(self, key: str, value: any, expires: float) -> bool:
+        # Used for leases/locks, which must never be answered from a local copy
+        return await self.remote.add(key, value, expires)
+
+    async def replace(self, key: str, expected: any, value: any, expires: float) -> bool:
+        if not await self.remote.replace(key, expected, value, expires):
+            return False
+        self._invalidate_local(key)
+        await self.remote.redis.publish(self.channel, self._message(key))
+        if value is not None:
+            self.local.set(key, _detached(value), expires)
+        return True
+
+    async def acquire_lease(self, key: str, owner: str, expires: float) -> bool:
+        return await self.remote.acquire_lease(key, owner, expires)
+
+    async def release_lease(self, key: str, owner: str) -> bool:
+        # Leases are never in L1, a release must not invalidate anything on other workers
+        return await self.remote.release_lease(key, owner)
+
+    async def get(self, key: str) -> any:
+        if (value := self.local.get(key, MISSING)) is not MISSING:
+            _L1_HITS.inc()
+            return _detached(value)
+        _L1_MISSES.inc()
+
+        invalidations = self._invalidations
+        value = await self.remote.get(key)
+        if value is None:
+            self.remote_stats.misses += 1
+            return value
+
+        self.remote_stats.hits += 1
+        # Don't resurrect a value that was invalidated while we were waiting for Redis
+        if invalidations == self._invalidations:
+            self.local.set(key, _detached(value))
+        return value
+
+    async def get_many(self, keys: list[str]) -> list[any]:
+        values = [self.local.get(key, MISSING) for key in keys]
+        values = [value if value is MISSING else _detached(value) for value in values]
+        missing = [key for key, value in zip(keys, values) if value is MISSING]
+        _L1_HITS.inc(len(keys) - len(missing))
+        _L1_MISSES.inc(len(missing))
+        if not missing:
+            return values
+
+        invalidations = self._invalidations
+        remote = dict(zip(missing, await self.remote.get_many(missing)))
+        for key, value in remote.items():
+            if value is None:
+                self.remote_stats.misses += 1
+                continue
+            self.remote_stats.hits += 1
+            if invalidations == self._invalidations:
+                self.local.set(key, _detached(value))
+        return [remote[key] if value is MISSING else value for key, value in zip(keys, values)]
+
+    async def set_many(self, mapping: dict[str, any], expires: float) -> bool:
+        async with self.pipeline() as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, value, expires)
+        return all(pipe.results)
+
+    async def remove_key(self, key: str) -> bool:
+        async with self.pipeline() as pipe:
+            pipe.remove_key(key)
+        return pipe.results[0]
+
+    async def delete_many(self, keys: list[str]) -> int:
+        async with self.pipeline() as pipe:
+            for key in keys:
+                pipe.remove_key(key)
+        return sum(pipe.results)
+
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = False) -> AsyncIterator['TieredPipeline']:
+        async with self.remote.pipeline(transaction) as remote_pipe:
+            pipe = TieredPipeline(self, remote_pipe)
+            yield pipe
+            await pipe.execute()
+
+    async def flash_all(self) -> bool:
+        self._invalidate_local(FLUSH_ALL)
+        result = await self.remote.flash_all()
+        await self.remote.redis.publish(self.channel, self._message(FLUSH_ALL))
+        return result
+
+    async def stats(self) -> dict:
+        """ Hit/miss/eviction counters per tier. L2 evictions are server-wide (Redis `evicted_keys`) """
+        info = await self.remote.redis.info('stats')
+        self.remote_stats.evictions = int(info.get('evicted_keys', 0))
+        return {'l1': self.local.stats.dict(), 'l2': self.remote_stats.dict()}
+
+    def _message(self, key: str) -> str:
+        return f'{self.node_id}:{key}'
+
+    def _invalidate_local(self, key: str) -> None:
+        self._invalidations += 1
+        if key == FLUSH_ALL:
+            self.local.clear()
+        else:
+            self.local.pop(key)
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.remote.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                # Anything could have changed while we were not subscribed
+                self._invalidate_local(FLUSH_ALL)
+                async for message in pubsub.listen():
+                    node_id, _, key = message['data'].decode('utf-8').partition(':')
+                    if node_id != self.node_id:
+                        self._invalidate_local(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache invalidation listener failed, resubscribing")
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+            finally:
+                await pubsub.close()
+
+
+class TieredPipeline(CachePipeline):
+    """ Writes go to Redis together with their invalidation messages, reads bypass L1 """
+
+    def __init__(self, cache: TieredCache, remote_pipe: RedisPipeline):
+        self.results = []
+        self._cache = cache
+        self._remote_pipe = remote_pipe
+        self._after_execute: list[Callable[[], None]] = []
+
+    def set(self, key: str, value: any, expires: float) -> 'TieredPipeline':
+        self._cache._invalidate_local(key)
+        self._remote_pipe.set(key, value, expires)
+        self._remote_pipe.publish(self._cache.channel, self._cache._message(key))
+        value = _detached(value)
+        self._after_execute.append(lambda: self._cache.local.set(key, value, expires))
+        return self
+
+    def get(self, key: str) -> 'TieredPipeline':
+        self._remote_pipe.get(key)
+        return self
+
+    def remove_key(self, key: str) -> 'TieredPipeline':
+        self._cache._invalidate_local(key)
+        self._remote_pipe.remove_key(key)
+        self._remote_pipe.publish(self._cache.channel, self._cache._message(key))
+        return self
+
+    async def execute(self) -> list[any]:
+        after_execute, self._after_execute = self._after_execute, []
+        self.results = await self._remote_pipe.execute()
+        for action in after_execute:
+            action()
+        return self.results
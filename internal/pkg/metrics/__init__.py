@@ -0,0 +1,12 @@
+from .asgi import MetricsMiddleware, metrics_endpoint
+from .loop import LoopLagMonitor
+from .registry import (CACHE_OPERATION_DURATION, CACHE_REQUESTS,
+                       DB_QUERY_DURATION, EVENT_LOOP_LAG, HTTP_REQUEST_DURATION,
+                       PASSWORD_HASH_DURATION, RATE_LIMITED_REQUESTS,
+                       render_metrics)
+
+__all__ = [
+    'CACHE_OPERATION_DURATION', 'CACHE_REQUESTS', 'DB_QUERY_DURATION', 'EVENT_LOOP_LAG', 'HTTP_REQUEST_DURATION',
+    'LoopLagMonitor', 'MetricsMiddleware', 'PASSWORD_HASH_DURATION', 'RATE_LIMITED_REQUESTS', 'metrics_endpoint',
+    'render_metrics',
+]
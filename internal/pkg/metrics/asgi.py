@@ -0,0 +1,52 @@
+import time
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from internal.pkg.metrics.registry import HTTP_REQUEST_DURATION, render_metrics
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class MetricsMiddleware:
+    """ Observes request latency labelled with the `name` of the matched route.
+
+    Plain ASGI middleware: no request/response objects are built for the wrapped app.
+    Unknown paths share one label so scanners can't blow up the series count.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route_names: dict | None = None
+
+    def _route_name(self, scope: Scope) -> str:
+        if self._route_names is None:
+            routes = scope['app'].routes
+            self._route_names = {route.endpoint: route.name for route in routes if hasattr(route, 'endpoint')}
+        return self._route_names.get(scope.get('endpoint'), UNMATCHED_ROUTE)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_DURATION.labels(self._route_name(scope), scope['method'], status_code).observe(
+                time.perf_counter() - started
+            )
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+from internal.pkg.metrics.registry import EVENT_LOOP_LAG
+
+
+class LoopLagMonitor:
+    """ Wakes up every `interval` seconds and records how late the wake-up was.
+
+    A lag close to the request latency means the loop is blocked by CPU work rather than
+    waiting on Redis/Postgres.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            scheduled = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(time.perf_counter() - scheduled, 0.0))
@@ -0,0 +1,54 @@
+""" Process-wide Prometheus metrics.
+
+Under gunicorn set PROMETHEUS_MULTIPROC_DIR (see `internal/gunicorn_conf.py`): every worker then
+writes its samples to that directory and `/metrics` aggregates all workers, whichever one serves it.
+"""
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Histogram, generate_latest,
+                               multiprocess)
+
+# Sub-millisecond cache calls up to multi-second requests
+LATENCY_BUCKETS = (
+    .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0,
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route name',
+    ['route', 'method', 'status'], buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by layer and result',
+    ['layer', 'result'],
+)
+CACHE_OPERATION_DURATION = Histogram(
+    'cache_operation_duration_seconds', 'Redis round trip latency by cache operation',
+    ['operation'], buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'SQL statement latency, `_count` is the query count',
+    ['database'], buckets=LATENCY_BUCKETS,
+)
+PASSWORD_HASH_DURATION = Histogram(
+    'password_hash_duration_seconds', 'bcrypt time including the wait for a hashing worker',
+    ['operation'], buckets=(.01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0),
+)
+RATE_LIMITED_REQUESTS = Counter(
+    'rate_limited_requests_total', 'Requests rejected with 429 by route name',
+    ['route'],
+)
+EVENT_LOOP_LAG = Histogram(
+    'event_loop_lag_seconds', 'Delay of a periodic event loop callback past its schedule',
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5),
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """ Exposition of this process, or of every worker in multiprocess mode """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,4 @@
+from .middleware import ProfilingMiddleware
+from .tokens import sign_profile_token, verify_profile_token
+
+__all__ = ['ProfilingMiddleware', 'sign_profile_token', 'verify_profile_token']
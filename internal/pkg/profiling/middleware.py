@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from typing import Literal
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from internal.pkg.profiling.tokens import verify_profile_token
+
+logger = logging.getLogger(__name__)
+
+ProfileFormat = Literal['speedscope', 'pstats', 'html']
+
+PROFILE_HEADER = b'x-profile'
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class ProfilingMiddleware:
+    """ Samples the call stack of selected requests with pyinstrument and writes one file per request.
+
+    A request is profiled when it carries a valid signed `X-Profile` header (see `sign_profile_token`)
+    or is picked by `sample_rate`. The async-aware profiler follows the request's task across await
+    points, so the profile shows the request's wall-clock time, waits on Redis/Postgres included.
+    Other requests share the process, so there is no per-request CPU figure: read the profile's
+    frames instead. The file name goes to the `X-Profile-Id` response header. Unprofiled requests
+    only pay for a header lookup and a random number.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            directory: str,
+            secret: str | None = None,
+            sample_rate: float = 0.0,
+            interval: float = 0.001,
+            output_format: ProfileFormat = 'speedscope',
+    ):
+        self.app = app
+        self.directory = directory
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.output_format = output_format
+        self._renderer = None
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def renderer(self):
+        if self._renderer is None:
+            from pyinstrument import renderers
+
+            self._renderer = {
+                'speedscope': renderers.SpeedscopeRenderer,
+                'pstats': renderers.PstatsRenderer,
+                'html': renderers.HTMLRenderer,
+            }[self.output_format]()
+        return self._renderer
+
+    def _should_profile(self, scope: Scope) -> bool:
+        if self.secret is not None:
+            for name, value in scope['headers']:
+                if name == PROFILE_HEADER:
+                    return verify_profile_token(self.secret, value.decode('latin-1'))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not self._should_profile(scope):
+            return await self.app(scope, receive, send)
+
+        from pyinstrument import Profiler
+
+        name = f'{time.strftime("%Y%m%dT%H%M%S")}-{scope["method"]}-{_UNSAFE.sub("_", scope["path"]).strip("_")}'
+        profile_id = f'{name}-{uuid.uuid4().hex[:8]}.{self.renderer.output_file_extension}'
+        profiler = Profiler(interval=self.interval, async_mode='enabled')
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []), (b'x-profile-id', profile_id.encode('ascii'))]
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session = profiler.stop()
+            # Rendering takes milliseconds, keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self._write, session, profile_id)
+
+    def _write(self, session, profile_id: str) -> None:
+        path = os.path.join(self.directory, profile_id)
+        try:
+            output = self.renderer.render(session)
+            if self.renderer.output_is_binary:
+                # pyinstrument returns binary output as a surrogate-escaped str
+                with open(path, 'wb') as f:
+                    f.write(output.encode('utf-8', errors='surrogateescape'))
+            else:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(output)
+        except Exception:
+            logger.exception("Failed to write profile %s", profile_id)
@@ -0,0 +1,20 @@
+import hashlib
+import hmac
+import time
+
+
+def _signature(secret: str, expires_at: int) -> str:
+    return hmac.new(secret.encode('utf-8'), f'profile:{expires_at}'.encode('ascii'), hashlib.sha256).hexdigest()
+
+
+def sign_profile_token(secret: str, ttl: float = 600) -> str:
+    """ Value for the `X-Profile` header, valid for `ttl` seconds """
+    expires_at = int(time.time() + ttl)
+    return f'{expires_at}.{_signature(secret, expires_at)}'
+
+
+def verify_profile_token(secret: str, token: str) -> bool:
+    expires_at, _, signature = token.partition('.')
+    if not expires_at.isdigit() or int(expires_at) < time.time():
+        return False
+    return hmac.compare_digest(signature, _signature(secret, int(expires_at)))
@@ -0,0 +1,5 @@
+from .interface import Rate, RateLimiter
+from .memory import MemoryRateLimiter
+from .redis_ import RedisRateLimiter
+
+__all__ = ['MemoryRateLimiter', 'Rate', 'RateLimiter', 'RedisRateLimiter']
@@ -0,0 +1,23 @@
+import abc
+from dataclasses import dataclass
+from typing import Protocol, Sequence
+
+
+@dataclass(frozen=True)
+class Rate:
+    """ `limit` calls per `period` seconds, all of them may come in one burst """
+    limit: int
+    period: float
+
+    @property
+    def interval(self) -> float:
+        return self.period / self.limit
+
+
+class RateLimiter(Protocol):
+    @abc.abstractmethod
+    async def acquire(self, rules: Sequence[tuple[str, Rate]]) -> float:
+        """ Take one call from every `(key, rate)` bucket, or from none of them.
+
+        :return: 0 when allowed, otherwise seconds until the call would be allowed
+        """
@@ -0,0 +1,29 @@
+import time
+from typing import Callable, Sequence
+
+from internal.pkg.ratelimit.interface import Rate, RateLimiter
+
+
+class MemoryRateLimiter(RateLimiter):
+    """ Per-process GCRA, same semantics as `RedisRateLimiter`; for tests and single-worker setups """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._tats: dict[str, float] = {}
+
+    async def acquire(self, rules: Sequence[tuple[str, Rate]]) -> float:
+        now = self.clock()
+        retry_after, tats = 0.0, []
+        for key, rate in rules:
+            tat = max(self._tats.get(key, now), now) + rate.interval
+            retry_after = max(retry_after, tat - rate.period - now)
+            tats.append(tat)
+        if retry_after > 0:
+            return retry_after
+
+        for (key, _), tat in zip(rules, tats):
+            self._tats[key] = tat
+        # Drop buckets that are full again, they are equal to missing ones
+        if len(self._tats) > 10_000:
+            self._tats = {key: tat for key, tat in self._tats.items() if tat > now}
+        return 0.0
@@ -0,0 +1,53 @@
+import logging
+from typing import Sequence
+
+from redis.exceptions import RedisError
+
+from internal.pkg.cache import RedisCache
+from internal.pkg.ratelimit.interface import Rate, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# GCRA: a bucket is one key holding its "theoretical arrival time". All buckets are checked
+# first and updated only when every one of them allows the call. The clock is Redis' own,
+# so workers on different hosts agree on it. Floats are returned as strings, Redis would
+# truncate Lua numbers to integers.
+GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local retry_after = 0
+local tats = {}
+for i, key in ipairs(KEYS) do
+    local period = tonumber(ARGV[2 * i])
+    local tat = math.max(tonumber(redis.call('GET', key)) or now, now) + tonumber(ARGV[2 * i - 1])
+    retry_after = math.max(retry_after, tat - period - now)
+    tats[i] = tat
+end
+if retry_after > 0 then
+    return tostring(retry_after)
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, tostring(tats[i]), 'PX', math.ceil((tats[i] - now) * 1000))
+end
+return '0'
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """ Shared by every worker, one EVALSHA round trip per call.
+
+    Fails open: when Redis is unavailable the call is allowed and the error is logged.
+    """
+
+    def __init__(self, cache: RedisCache, prefix: str = 'rl:'):
+        self.prefix = prefix
+        self._script = cache.redis.register_script(GCRA_SCRIPT)
+
+    async def acquire(self, rules: Sequence[tuple[str, Rate]]) -> float:
+        keys = [self.prefix + key for key, _ in rules]
+        args = [value for _, rate in rules for value in (rate.interval, rate.period)]
+        try:
+            return float(await self._script(keys=keys, args=args))
+        except RedisError:
+            logger.exception("Rate limiter is unavailable, letting the call through")
+            return 0.0
@@ -2,7 +2,7 @@ from typing import AsyncIterator, Callable, Iterator
 
 import pytest
 from asgi_lifespan import LifespanManager
-from dependency_injector import providers
+from dependency_injector import containers, providers
 from faker import Faker
 from fastapi import FastAPI
 from httpx import AsyncClient
@@ -10,10 +10,10 @@ from starlette.testclient import TestClient
 
 from internal.app.api.dependencies import get_current_user
 from internal.app.app import create_app
-from internal.app.container import Container
 from internal.db.tables.user import User
 from internal.models.schemas import UserSchema
-from internal.pkg.cache import Cache
+from internal.pkg.cache import Cache, SequentialPipeline
+from internal.pkg.ratelimit import MemoryRateLimiter
 
 
 class CacheMock(Cache):
@@ -30,9 +30,28 @@ class CacheMock(Cache):
         self.cache[key] = value
         return True
 
+    async def add(self, key: str, value: any, expires: float) -> bool:
+        if key in self.cache:
+            return False
+        self.cache[key] = value
+        return True
+
     async def get(self, key: str) -> any:
         return self.cache.get(key, None)
 
+    async def get_many(self, keys: list[str]) -> list[any]:
+        return [self.cache.get(key) for key in keys]
+
+    async def set_many(self, mapping: dict[str, any], expires: float) -> bool:
+        self.cache.update(mapping)
+        return True
+
+    async def delete_many(self, keys: list[str]) -> int:
+        return sum(self.cache.pop(key, None) is not None for key in keys)
+
+    def pipeline(self, transaction: bool = False) -> SequentialPipeline:
+        return SequentialPipeline(self)
+
     async def flash_all(self) -> bool:
         self.cache.clear()
         return True
@@ -41,8 +60,9 @@ class CacheMock(Cache):
         return bool(self.cache.pop(key, None))
 
 
-class OverridingContainer(Container):
+class OverridingContainer(containers.DeclarativeContainer):
     cache = providers.Singleton(CacheMock)
+    rate_limiter = providers.Singleton(MemoryRateLimiter)
 
 
 @pytest.fixture
@@ -99,12 +119,14 @@ def user_table_factory(faker: 'Faker') -> Callable[..., 'User']:
             password: str = faker.password(12),
             username: str = faker.user_name(),
             email: str = faker.email(),
+            version: int = 1,
     ):
         return User(
             id=_id,
             password=password,
             username=username,
-            email=email
+            email=email,
+            version=version,
         )
 
     return _make_user_table
@@ -117,8 +139,9 @@ def user_schema_factory(faker: 'Faker', user_table_factory) -> Callable[..., 'Us
             password: str = faker.password(12),
             username: str = faker.user_name(),
             email: str = faker.email(),
+            version: int = 1,
     ):
-        user = user_table_factory(_id, password, username, email)
+        user = user_table_factory(_id, password, username, email, version)
         return UserSchema.from_orm(user)
 
     return _make_user_schema
@@ -0,0 +1,217 @@
+""" Test auth helpers """
+
+import asyncio
+import time
+from unittest import mock
+
+import bcrypt
+import pytest
+from dependency_injector import providers
+from fastapi import HTTPException
+from jose import jwt
+
+from internal.app.api.dependencies import get_current_user
+from internal.app.settings import GlobalSettings
+from internal.db.repositories.user import UserRepository
+from internal.pkg.auth import (AuthJWT, HashingQueueFull, PasswordHasher,
+                               RefreshSessionStore, TokenCache)
+from internal.pkg.cache import CacheKeys, RedisCache
+from internal.pkg.ratelimit import MemoryRateLimiter, Rate
+from tests.conftest import CacheMock
+
+
+@pytest.mark.asyncio
+async def test_hasher_roundtrip():
+    auth = AuthJWT(secret_key='secret', hasher=PasswordHasher(max_workers=1))
+    hashed = await auth.encode_password_async('12312300')
+
+    assert await auth.verify_password_async('12312300', hashed)
+    assert not await auth.verify_password_async('hackerman', hashed)
+
+
+@pytest.mark.asyncio
+async def test_hasher_rejects_when_queue_is_full():
+    hasher = PasswordHasher(max_workers=1, max_queue=0)
+    auth = AuthJWT(secret_key='secret', hasher=hasher)
+
+    first = asyncio.create_task(hasher.hash(b'12312300'))
+    await asyncio.sleep(0)
+    with pytest.raises(HashingQueueFull):
+        await hasher.hash(b'12312300')
+    with pytest.raises(HTTPException) as exc:
+        await auth.encode_password_async('12312300')
+    assert exc.value.status_code == 503
+    assert exc.value.headers['Retry-After']
+
+    await first
+    assert hasher.in_flight == 0
+
+
+def test_token_cache_skips_verification():
+    auth = AuthJWT(secret_key='secret', token_cache=TokenCache())
+    token = auth.encode_token(42)
+
+    with mock.patch('internal.pkg.auth.auth_jwt.jwt.decode', wraps=jwt.decode) as decode:
+        assert auth.decode_token(token) == '42'
+        assert auth.decode_token(token) == '42'
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc:
+                auth.decode_token('garbage')
+            assert exc.value.detail == 'Invalid token'
+
+    assert decode.call_count == 2
+
+
+def test_rejected_tokens_dont_evict_valid_ones():
+    cache = TokenCache(maxsize=2, negative_maxsize=2)
+    valid = cache.digest('valid')
+    cache.accept(valid, {'sub': '42'}, time.time() + 60)
+
+    for i in range(10):
+        cache.reject(cache.digest(f'garbage{i}'), 'Invalid token')
+
+    assert cache.get(valid) == (True, {'sub': '42'})
+    assert cache.get(cache.digest('garbage9')) == (False, 'Invalid token')
+    assert cache.get(cache.digest('garbage0')) is None
+
+
+@pytest.mark.asyncio
+async def test_memory_rate_limiter_takes_from_every_bucket_or_none():
+    now = 0.0
+    limiter = MemoryRateLimiter(clock=lambda: now)
+    rules = [('ip', Rate(3, 60)), ('user', Rate(2, 60))]
+
+    assert [await limiter.acquire(rules) for _ in range(3)] == [0, 0, 30]
+    # The rejected call took nothing from the IP bucket
+    assert await limiter.acquire([('ip', Rate(3, 60))]) == 0
+    assert await limiter.acquire([('ip', Rate(3, 60))]) == 20
+
+    now = 30.0
+    assert await limiter.acquire(rules) == 0
+
+
+@pytest.mark.asyncio
+async def test_sign_in_is_rate_limited(app, client, user_schema_factory):
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.get.return_value = None
+    settings = GlobalSettings(RATE_LIMIT_SIGN_IN_PER_USERNAME=2, RATE_LIMIT_PERIOD=60)
+
+    with app.container.user_repository.override(repository_mock), \
+            app.container.settings.override(providers.Object(settings)):
+        responses = [
+            await client.post(app.url_path_for('auth:login'), json={'username': 'victim', 'password': 'guess'})
+            for _ in range(3)
+        ]
+        other = await client.post(app.url_path_for('auth:login'), json={'username': 'other', 'password': 'guess'})
+
+    assert [response.status_code for response in responses] == [400, 400, 429]
+    assert responses[-1].headers['Retry-After'] == '30'
+    assert other.status_code == 400
+    assert repository_mock.get.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_refresh_session_rotation():
+    sessions = RefreshSessionStore(CacheMock())
+    first = await sessions.create(42, fingerprint='laptop')
+
+    user_id, second = await sessions.rotate(first, fingerprint='laptop')
+    assert user_id == 42 and second != first
+
+    with pytest.raises(HTTPException) as exc:
+        await sessions.rotate(second, fingerprint='phone')
+    assert exc.value.status_code == 401
+
+    # Replaying a consumed token revokes the whole family
+    with pytest.raises(HTTPException):
+        await sessions.rotate(first, fingerprint='laptop')
+    with pytest.raises(HTTPException):
+        await sessions.rotate(second, fingerprint='laptop')
+
+
+@pytest.mark.asyncio
+async def test_sign_in_issues_claims_and_refresh_token(app, client, user_schema_factory):
+    user = user_schema_factory(password=bcrypt.hashpw(b'secret', bcrypt.gensalt(4)))
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.get.return_value = user
+    repository_mock.get_by_id.return_value = user
+
+    with app.container.user_repository.override(repository_mock):
+        response = await client.post(
+            app.url_path_for('auth:login'), json={'username': user.username, 'password': 'secret', 'fingerprint': 'x'},
+        )
+        assert response.status_code == 200
+        tokens = response.json()
+
+        for _ in range(2):
+            me = await client.get(app.url_path_for('user:me'), headers={'Authorization': f'Bearer {tokens["token"]}'})
+            assert me.status_code == 200
+            assert me.json()['username'] == user.username
+        # The principal comes from the claims, only the cached body of /me was loaded
+        assert repository_mock.get_by_id.call_count == 1
+
+        body = {'refresh_token': tokens['refresh_token'], 'fingerprint': 'x'}
+        refreshed = await client.post(app.url_path_for('auth:refresh'), json=body)
+        replayed = await client.post(app.url_path_for('auth:refresh'), json=body)
+        assert refreshed.status_code == 200
+        assert replayed.status_code == 401
+
+        body = {'refresh_token': refreshed.json()['refresh_token'], 'fingerprint': 'x'}
+        assert (await client.post(app.url_path_for('auth:refresh'), json=body)).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_sign_in_rehashes_on_cost_change(app, client, user_schema_factory):
+    user = user_schema_factory(password=bcrypt.hashpw(b'secret', bcrypt.gensalt(4)))
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.get.return_value = user
+    auth = AuthJWT('secret', hasher=PasswordHasher(executor='inline', rounds=5))
+    credentials = {'username': user.username, 'password': 'secret'}
+
+    with app.container.user_repository.override(repository_mock), app.container.auth.override(auth):
+        response = await client.post(app.url_path_for('auth:login'), json=credentials)
+        assert response.status_code == 200
+        _id, rehashed = repository_mock.update_password.call_args.args
+        assert _id == user.id and rehashed.startswith(b'$2b$05$')
+
+        repository_mock.get.return_value = user.copy(update={'password': rehashed})
+        repository_mock.update_password.reset_mock()
+        response = await client.post(app.url_path_for('auth:login'), json=credentials)
+        assert response.status_code == 200
+        assert not repository_mock.update_password.called
+
+
+@pytest.mark.asyncio
+async def test_principal_is_cached_through_redis(user_schema_factory):
+    user = user_schema_factory()
+    auth = AuthJWT(secret_key='secret')
+    token = auth.encode_token(user.id)
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.get_by_id.return_value = user
+
+    # The real client builds the commands, a dict stands in for the server
+    cache = RedisCache()
+    stored = {}
+
+    async def execute_command(name, *args, **options):
+        if name == 'MGET':
+            return [stored.get(key) for key in args]
+        if name == 'GET':
+            return stored.get(args[0])
+        key, value, *flags = args
+        if 'NX' in flags and key in stored:
+            return None
+        stored[key] = value
+        return True
+
+    cache.redis.execute_command = mock.AsyncMock(side_effect=execute_command)
+    kwargs = dict(
+        repository=repository_mock, auth=auth, cache=cache, keys=CacheKeys(cache, namespace='test'),
+        settings=GlobalSettings(PRINCIPAL_CACHE_TTL=30.0),
+    )
+
+    for _ in range(2):
+        assert (await get_current_user(token, **kwargs)).id == user.id
+    assert repository_mock.get_by_id.call_count == 1
+    *_, principal_set = [call.args for call in cache.redis.execute_command.await_args_list if call.args[0] == 'SET']
+    assert principal_set[3:] == ('PX', 30000)
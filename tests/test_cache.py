@@ -0,0 +1,433 @@
+""" Test in-process cache layers """
+
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+from redis.asyncio.client import Pipeline
+
+from internal.pkg.cache import (BloomFilter, CacheKeys, CacheLoader,
+                                CacheSerializer, ExistenceFilter, KeyFamily,
+                                LRUCache, RedisCache, SequentialPipeline,
+                                TieredCache, tiered)
+from internal.pkg.cache.codecs import FLAG_ZLIB, available_codecs
+from tests.conftest import CacheMock
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class PubSubMock:
+    def __init__(self, remote: 'RemoteMock'):
+        self.remote = remote
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, channel: str) -> None:
+        self.remote.subscriptions.append(self)
+
+    async def listen(self):
+        while True:
+            message = await self.messages.get()
+            if isinstance(message, Exception):
+                raise message
+            yield {'type': 'message', 'data': message.encode('utf-8')}
+
+    async def close(self) -> None:
+        if self in self.remote.subscriptions:
+            self.remote.subscriptions.remove(self)
+
+
+class PublishingPipeline(SequentialPipeline):
+    def __init__(self, cache: 'RemoteMock'):
+        super().__init__(cache)
+        self._messages = []
+
+    def publish(self, channel: str, message: str) -> 'PublishingPipeline':
+        self._messages.append(message)
+        return self
+
+    async def execute(self) -> list[any]:
+        results = await super().execute()
+        messages, self._messages = self._messages, []
+        for message in messages:
+            await self._cache.publish(self._cache.channel, message)
+        return results
+
+
+class RemoteMock(CacheMock):
+    """ The Redis behind TieredCache nodes: storage, pipelines and the invalidation channel """
+
+    def __init__(self, cache=None):
+        super().__init__(cache)
+        self.redis = self
+        self.channel = 'cache:invalidate'
+        self.subscriptions: list[PubSubMock] = []
+        self.get_gate: asyncio.Event | None = None
+
+    async def get(self, key: str) -> any:
+        value = await super().get(key)
+        # The reply is on its way while other commands run
+        if self.get_gate is not None:
+            await self.get_gate.wait()
+        return value
+
+    async def publish(self, channel: str, message: str) -> int:
+        for subscription in self.subscriptions:
+            subscription.messages.put_nowait(message)
+        return len(self.subscriptions)
+
+    def pipeline(self, transaction: bool = False) -> PublishingPipeline:
+        return PublishingPipeline(self)
+
+    def pubsub(self, **kwargs) -> PubSubMock:
+        return PubSubMock(self)
+
+
+async def settle():
+    """ Let the listeners handle what was published """
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats.dict() == {'hits': 3, 'misses': 1, 'evictions': 1}
+
+
+def test_lru_expires_entries():
+    clock = Clock()
+    cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=1)
+
+    clock.now = 2
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+
+    clock.now = 6
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_loader_coalesces_concurrent_misses():
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {'id': 1}
+
+    loader = CacheLoader(CacheMock())
+    results = await asyncio.gather(*(loader.get_or_load('user_get_1', load, 60) for _ in range(10)))
+
+    assert calls == 1
+    assert results == [{'id': 1}] * 10
+    assert await loader.get_or_load('user_get_1', load, 60) == {'id': 1}
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_loader_waits_for_lease_holder():
+    cache = CacheMock()
+    await cache.add('user_get_1:lease', 'other-worker', 5)
+
+    async def fill_from_other_worker():
+        await asyncio.sleep(0.05)
+        await cache.set('user_get_1', {'v': {'id': 1}, 'x': time.time() + 60, 'd': 0.0}, 60)
+
+    async def load():
+        raise AssertionError('must not hit the database while another worker loads')
+
+    loader = CacheLoader(cache, poll_interval=0.01)
+    _, result = await asyncio.gather(fill_from_other_worker(), loader.get_or_load('user_get_1', load, 60))
+
+    assert result == {'id': 1}
+
+
+@pytest.mark.asyncio
+async def test_loader_serves_stale_while_revalidating():
+    cache = CacheMock()
+    await cache.set('user_get_1', {'v': {'id': 1, 'username': 'old'}, 'x': time.time() - 1, 'd': 0.0}, 60)
+
+    async def load():
+        return {'id': 1, 'username': 'new'}
+
+    loader = CacheLoader(cache)
+    assert await loader.get_or_load('user_get_1', load, 60) == {'id': 1, 'username': 'old'}
+
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert await loader.get_or_load('user_get_1', load, 60) == {'id': 1, 'username': 'new'}
+
+
+@pytest.mark.asyncio
+async def test_loader_refresh_does_not_undo_invalidation():
+    cache = CacheMock()
+    await cache.set('user_get_1', {'v': {'username': 'old'}, 'x': time.time() - 1, 'd': 0.0}, 60)
+    loaded = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_load():
+        loaded.set()
+        await release.wait()
+        return {'username': 'read before the update'}
+
+    async def load():
+        return {'username': 'updated'}
+
+    loader = CacheLoader(cache)
+    assert await loader.get_or_load('user_get_1', slow_load, 60) == {'username': 'old'}
+    await loaded.wait()
+
+    # The key is invalidated while the refresh is loading; a miss now must not wait for the refresh
+    await cache.remove_key('user_get_1')
+    assert await loader.get_or_load('user_get_1', load, 60) == {'username': 'updated'}
+
+    release.set()
+    await asyncio.sleep(0.01)
+    assert await loader.get_or_load('user_get_1', load, 60) == {'username': 'updated'}
+
+
+@pytest.mark.asyncio
+async def test_loader_releases_only_its_own_lease():
+    cache = CacheMock()
+
+    async def load():
+        # Our lease expired mid-load and another worker took it
+        cache.cache['user_get_1:lease'] = 'other-worker'
+        return {'id': 1}
+
+    assert await CacheLoader(cache).get_or_load('user_get_1', load, 60) == {'id': 1}
+    assert cache.cache['user_get_1:lease'] == 'other-worker'
+
+
+@pytest.mark.parametrize('codec', list(available_codecs()))
+def test_serializer_reads_every_codec(codec):
+    value = {'v': [{'id': i, 'username': f'user{i}'} for i in range(50)], 'x': 1.5, 'd': 0.1}
+    writer = CacheSerializer(codec, compress_threshold=64)
+    reader = CacheSerializer('json')
+
+    raw = writer.dumps(value)
+    assert raw[3] & FLAG_ZLIB
+    assert reader.loads(raw) == value
+    assert reader.loads(b'{"legacy": "value"}') == {'legacy': 'value'}
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_sends_integer_expiries():
+    cache = RedisCache()
+    # The real client validates the arguments, only the network is left out
+    cache.redis.execute_command = mock.AsyncMock(return_value=True)
+    queued = []
+
+    async def execute(pipe, raise_on_error=True):
+        queued.extend(args for args, _ in pipe.command_stack)
+        return [True] * len(pipe.command_stack)
+
+    with mock.patch.object(Pipeline, 'execute', execute):
+        await cache.set('a', 1, 3660.0)
+        await cache.add('b', 1, 5.0)
+        await cache.set_many({'c': 1}, 0.5)
+        async with cache.pipeline() as pipe:
+            pipe.set('d', 1, 60.0)
+
+    sent = [call.args[3:] for call in cache.redis.execute_command.await_args_list]
+    assert sent == [('PX', 3660000), ('PX', 5000, 'NX')]
+    assert [args[3:] for args in queued] == [('PX', 500), ('PX', 60000)]
+
+
+@pytest.mark.asyncio
+async def test_tiered_write_executes_one_redis_pipeline():
+    cache = TieredCache(RedisCache())
+    execute = mock.AsyncMock(return_value=[True, 1])
+
+    with mock.patch.object(Pipeline, 'execute', execute):
+        assert await cache.set('key', 'value', 60)
+
+    execute.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_loader_keeps_bytes_values_encoded():
+    serializer = CacheSerializer('json', compress_threshold=64)
+    body = b'{"id":1,"username":"' + b'x' * 100 + b'"}'
+
+    async def load():
+        return body
+
+    cache = CacheMock()
+    loader = CacheLoader(cache)
+    assert await loader.get_or_load('user_body_1', load, 60) == body
+
+    stored = cache.cache['user_body_1']
+    assert serializer.loads(serializer.dumps(stored)) == stored
+    assert await loader.get_or_load('user_body_1', load, 60) == body
+
+
+@pytest.mark.asyncio
+async def test_loader_remembers_missing_keys():
+    calls = []
+
+    async def load():
+        calls.append(1)
+
+    async def load_many(keys):
+        calls.append(keys)
+        return {'user_get_1': b'one'}
+
+    cache = CacheMock()
+    loader = CacheLoader(cache)
+    assert await loader.get_or_load('user_get_404', load, 60, negative_ttl=30) is None
+    assert await loader.get_or_load('user_get_404', load, 60, negative_ttl=30) is None
+    assert len(calls) == 1
+
+    keys = ['user_get_1', 'user_get_2', 'user_get_404']
+    assert await loader.get_many_or_load(keys, load_many, 60, negative_ttl=30) == {'user_get_1': b'one'}
+    assert await loader.get_many_or_load(keys, load_many, 60, negative_ttl=30) == {'user_get_1': b'one'}
+    assert calls[1:] == [['user_get_1', 'user_get_2']]
+
+    # Removing the key, as creating the entry does, drops the tombstone
+    await cache.remove_key('user_get_404')
+    await loader.get_or_load('user_get_404', load, 60, negative_ttl=30)
+    assert len(calls) == 3
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f'user{i}')
+
+    assert all(f'user{i}' in bloom for i in range(1000))
+    assert sum(f'other{i}' in bloom for i in range(10_000)) < 300
+
+
+@pytest.mark.asyncio
+async def test_existence_filter_reads_only_new_rows():
+    class Row:
+        def __init__(self, _id):
+            self.id, self.username = _id, f'user{_id}'
+
+    rows = [Row(_id) for _id in range(1, 6)]
+    pages = []
+
+    async def page(after, limit):
+        pages.append(after)
+        return [row for row in rows if after is None or row.id > after[0]][:limit]
+
+    existence = ExistenceFilter(page, ['username'], capacity=100, batch_size=2)
+    assert existence.might_contain('username', 'anyone') and not existence.ready
+
+    assert await existence.refresh() == 5
+    rows.append(Row(6))
+    assert await existence.refresh() == 1
+    assert pages == [None, (2,), (4,), (5,)]
+    assert existence.might_contain('username', 'user6')
+    assert not existence.might_contain('username', 'user7')
+
+
+@pytest.mark.asyncio
+async def test_cache_keys_invalidate_by_tag():
+    cache = CacheMock()
+    keys = CacheKeys(cache, namespace='test')
+    users = KeyFamily('user', '{id}', tags=('users',))
+    principals = KeyFamily('principal', '{id}', version=2, tags=('users',))
+    sessions = KeyFamily('session', '{id}')
+
+    user_key, principal_key, session_key = [(await keys.bind(family))(id=1) for family in (users, principals, sessions)]
+    assert user_key.startswith('test:user:v1:') and user_key.endswith(':1')
+    assert principal_key.startswith('test:principal:v2:')
+    assert (await keys.bind(users))(id=1) == user_key
+
+    await keys.invalidate('users')
+    assert (await keys.bind(users))(id=1) != user_key
+    assert (await keys.bind(principals))(id=1) != principal_key
+    assert (await keys.bind(sessions))(id=1) == session_key
+
+    # A lost generation comes back as a new one, never as the old keys
+    await cache.remove_key('test:gen:session')
+    assert (await keys.bind(sessions))(id=1) != session_key
+
+
+@pytest.fixture
+async def nodes():
+    remote = RemoteMock()
+    caches = [TieredCache(remote), TieredCache(remote)]
+    for cache in caches:
+        await cache.startup()
+    await settle()
+    yield remote, caches
+    for cache in caches:
+        await cache.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_tiered_invalidation_from_another_node_evicts_l1(nodes):
+    _, (writer, reader) = nodes
+    await writer.set('key', 'old', 60)
+    assert await reader.get('key') == 'old'
+    assert 'key' in reader.local
+
+    await writer.set('key', 'new', 60)
+    await settle()
+
+    assert 'key' not in reader.local
+    assert await reader.get('key') == 'new'
+
+
+@pytest.mark.asyncio
+async def test_tiered_invalidation_stops_a_racing_fill(nodes):
+    remote, (writer, reader) = nodes
+    await remote.set('key', 'old', 60)
+    remote.get_gate = asyncio.Event()
+
+    fill = asyncio.create_task(reader.get('key'))
+    await settle()
+    await writer.remove_key('key')
+    await settle()
+    remote.get_gate.set()
+
+    # Read before the removal: returned, but not kept in L1
+    assert await fill == 'old'
+    assert 'key' not in reader.local
+
+
+@pytest.mark.asyncio
+async def test_tiered_flushes_l1_after_resubscribe(nodes, monkeypatch):
+    monkeypatch.setattr(tiered, 'RESUBSCRIBE_DELAY', 0)
+    remote, (writer, reader) = nodes
+    reader.local.set('key', 'stale')
+
+    for subscription in list(remote.subscriptions):
+        subscription.messages.put_nowait(ConnectionError('connection lost'))
+    await settle()
+
+    assert 'key' not in reader.local
+    assert len(remote.subscriptions) == 2
+
+
+@pytest.mark.asyncio
+async def test_tiered_returns_copies_of_mutable_values(nodes):
+    _, (cache, _) = nodes
+    value = {'roles': ['user']}
+    await cache.set('key', value, 60)
+    value['roles'].append('admin')
+    (await cache.get('key'))['roles'].append('admin')
+
+    assert await cache.get('key') == {'roles': ['user']}
+    assert await cache.get_many(['key']) == [{'roles': ['user']}]
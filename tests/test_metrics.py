@@ -0,0 +1,47 @@
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+
+from internal.db.repositories.user import UserRepository
+from internal.pkg.metrics import EVENT_LOOP_LAG, LoopLagMonitor
+
+
+def sample(body: str, name: str) -> float:
+    for line in body.splitlines():
+        if line.startswith(name):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+
+@pytest.mark.asyncio
+async def test_metrics_are_labelled_by_route_name(auth_client, user_schema_factory, app):
+    client = auth_client()
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.get_by_id.return_value = user_schema_factory()
+    series = 'http_request_duration_seconds_count{method="GET",route="user:get",status="200"}'
+
+    before = sample(client.get('/metrics').text, series)
+    with app.container.user_repository.override(repository_mock):
+        client.get(app.url_path_for('user:get', _id=1))
+        client.get(app.url_path_for('user:get', _id=1))
+    client.get('/no/such/path')
+    body = client.get('/metrics').text
+
+    assert sample(body, series) == before + 2
+    assert 'route="<unmatched>",status="404"' in body
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_observes_blocking():
+    monitor = LoopLagMonitor(interval=0.01)
+    before = EVENT_LOOP_LAG._sum.get()
+
+    monitor.start()
+    await asyncio.sleep(0.005)
+    time.sleep(0.05)  # blocks the loop past the monitor's wake-up
+    await asyncio.sleep(0.02)
+    await monitor.stop()
+
+    assert EVENT_LOOP_LAG._sum.get() - before >= 0.03
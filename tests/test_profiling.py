@@ -0,0 +1,32 @@
+import json
+
+import pytest
+from httpx import AsyncClient
+
+from internal.pkg.profiling import (ProfilingMiddleware, sign_profile_token,
+                                    verify_profile_token)
+
+
+def test_profile_tokens():
+    token = sign_profile_token('secret', ttl=60)
+
+    assert verify_profile_token('secret', token)
+    assert not verify_profile_token('other', token)
+    assert not verify_profile_token('secret', sign_profile_token('secret', ttl=-1))
+    assert not verify_profile_token('secret', 'garbage')
+
+
+@pytest.mark.asyncio
+async def test_only_signed_requests_are_profiled(app, tmp_path):
+    middleware = ProfilingMiddleware(app, directory=str(tmp_path), secret='secret')
+
+    async with AsyncClient(app=middleware, base_url='http://testserver') as client:
+        plain = await client.get('/metrics')
+        forged = await client.get('/metrics', headers={'X-Profile': '9999999999.forged'})
+        signed = await client.get('/metrics', headers={'X-Profile': sign_profile_token('secret')})
+
+    assert 'X-Profile-Id' not in plain.headers and 'X-Profile-Id' not in forged.headers
+    assert 'X-Profile-CPU' not in signed.headers
+    [profile] = tmp_path.iterdir()
+    assert profile.name == signed.headers['X-Profile-Id']
+    assert json.loads(profile.read_text())['$schema'].startswith('https://www.speedscope.app')
@@ -0,0 +1,203 @@
+""" Test repository helpers without DB """
+
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+from alembic.script import ScriptDirectory
+from httpx import AsyncClient
+from pydantic import ValidationError
+from sqlalchemy import create_engine, text
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from internal.app.settings import GlobalSettings
+from internal.db.database import (COMMITTED_WRITES, MIGRATIONS_DIR, WRITES,
+                                  PostgresDatabase, WriteTrackingSession,
+                                  _track_commit, alembic_head_applied)
+from internal.db.pinning import ReadPin, ReadPinMiddleware, current_pin
+from internal.db.repositories.batching import BatchLoader, RepositoryBatcher
+from internal.db.repositories.user import UserRepository
+
+
+@pytest.mark.asyncio
+async def test_batch_loader_coalesces_one_tick():
+    batch_fn = mock.AsyncMock(side_effect=lambda keys: {key: key * 10 for key in keys if key != 3})
+    loader = BatchLoader(batch_fn)
+
+    results = await asyncio.gather(*(loader.load(key) for key in (1, 2, 2, 3)))
+
+    assert results == [10, 20, 20, None]
+    batch_fn.assert_awaited_once_with([1, 2, 3])
+
+
+@pytest.mark.asyncio
+async def test_batch_loader_propagates_errors():
+    loader = BatchLoader(mock.AsyncMock(side_effect=RuntimeError('db is down')), window=0.001)
+
+    results = await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+
+    assert all(isinstance(res, RuntimeError) for res in results)
+
+
+@pytest.mark.asyncio
+async def test_repository_batches_unique_lookups(user_schema_factory):
+    users = {_id: user_schema_factory(_id=_id, username=f'user{_id}', email=f'user{_id}@email.com') for _id in (1, 2)}
+    repository = UserRepository(context_async_session=mock.Mock(), batcher=RepositoryBatcher())
+
+    async def get_many_by(column, values):
+        return {getattr(user, column): user for user in users.values() if getattr(user, column) in values}
+
+    with mock.patch.object(UserRepository, 'get_many_by', side_effect=get_many_by) as patched:
+        by_id = await asyncio.gather(repository.get_by_id(1), repository.get_by_id(2), repository.get_by_id(3))
+        by_username = await asyncio.gather(repository.get(username='user2'), repository.get(username='user1'))
+
+    assert by_id == [users[1], users[2], None]
+    assert by_username == [users[2], users[1]]
+    assert patched.call_args_list == [mock.call('id', [1, 2, 3]), mock.call('username', ['user2', 'user1'])]
+
+
+@pytest.mark.asyncio
+async def test_batcher_keeps_repositories_with_other_sessions_apart():
+    batcher = RepositoryBatcher()
+    primary, replica = mock.Mock(), mock.Mock()
+    first = UserRepository(context_async_session=primary, batcher=batcher)
+    second = UserRepository(context_async_session=primary, context_read_session=replica, batcher=batcher)
+    same = UserRepository(context_async_session=primary, batcher=batcher)
+
+    assert batcher.loader(first, 'id') is batcher.loader(same, 'id')
+    assert batcher.loader(first, 'id') is not batcher.loader(second, 'id')
+
+
+@pytest.mark.asyncio
+async def test_batcher_keeps_pinned_reads_apart():
+    repository = UserRepository(context_async_session=mock.Mock(), batcher=RepositoryBatcher())
+    batches = []
+
+    async def get_many_by(column, values):
+        batches.append((values, current_pin.get().active))
+        return {}
+
+    async def get_by_id(_id, pin):
+        current_pin.set(pin)
+        return await repository.get_by_id(_id)
+
+    with mock.patch.object(UserRepository, 'get_many_by', side_effect=get_many_by):
+        await asyncio.gather(get_by_id(1, ReadPin()), get_by_id(2, ReadPin(time.time() + 60)))
+
+    assert sorted(batches) == [([1], False), ([2], True)]
+
+
+@pytest.mark.parametrize('budget, workers, expected', [
+    (None, 4, (5, 10)),
+    (40, 4, (5, 5)),
+    (8, 4, (2, 0)),
+    (4, 4, (1, 0)),
+])
+def test_db_pool_is_split_between_workers(budget, workers, expected):
+    settings = GlobalSettings(DB_CONNECTION_BUDGET=budget, WEB_CONCURRENCY=workers)
+
+    assert (settings.DB_WORKER_POOL_SIZE, settings.DB_WORKER_MAX_OVERFLOW) == expected
+
+
+def test_db_connection_budget_must_cover_every_worker():
+    with pytest.raises(ValidationError):
+        GlobalSettings(DB_CONNECTION_BUDGET=2, WEB_CONCURRENCY=4)
+
+
+@pytest.mark.asyncio
+async def test_reads_are_routed_to_healthy_replicas():
+    db = PostgresDatabase(
+        'postgresql+asyncpg://primary/db',
+        replica_urls=['postgresql+asyncpg://replica1/db', 'postgresql+asyncpg://replica2/db'],
+        max_replica_lag=1.0,
+        read_your_writes_window=60,
+    )
+    first, second = db._replicas
+    assert db._read_replica() is None
+
+    first.lag, second.lag = 0.1, 30.0
+    assert [db._read_replica() for _ in range(3)] == [first, first, first]
+
+    second.lag = 0.5
+    assert {db._read_replica() for _ in range(4)} == {first, second}
+
+    # A session that only read doesn't pin anything
+    async with db.async_session():
+        pass
+    assert db._read_replica() is not None
+
+
+@pytest.mark.asyncio
+async def test_writes_pin_only_the_writing_client():
+    db = PostgresDatabase(
+        'postgresql+asyncpg://primary/db', replica_urls=['postgresql+asyncpg://replica/db'], read_your_writes_window=60,
+    )
+    db._replicas[0].lag = 0.0
+    routed = []
+
+    async def endpoint(request):
+        if request.url.path == '/write':
+            db.pin_reads()
+        routed.append(db._read_replica())
+        return PlainTextResponse('')
+
+    app = ReadPinMiddleware(Starlette(routes=[Route('/write', endpoint), Route('/read', endpoint)]), window=60)
+    async with AsyncClient(app=app, base_url='http://test') as writer, \
+            AsyncClient(app=app, base_url='http://test') as other:
+        response = await writer.get('/write')
+        assert 'db_pin' in response.cookies
+        await writer.get('/read')
+        await other.get('/read')
+
+    assert routed[:2] == [None, None]
+    assert routed[2] is db._replicas[0]
+
+    # Only commits that wrote pin the client
+    session = WriteTrackingSession()
+    session.info[WRITES] = True
+    _track_commit(session)
+    assert session.info == {COMMITTED_WRITES: True}
+
+
+@pytest.mark.asyncio
+async def test_fast_reads_bypass_the_orm():
+    driver = mock.Mock(
+        fetchrow=mock.AsyncMock(return_value={'id': 1, 'password': "b'hash'", 'username': 'user1', 'email': 'e@mail.com'}),
+        fetch=mock.AsyncMock(return_value=[]),
+    )
+    session = mock.Mock(connection=mock.AsyncMock(return_value=mock.Mock(
+        get_raw_connection=mock.AsyncMock(return_value=mock.Mock(driver_connection=driver)),
+        sync_connection=mock.Mock(get_execution_options=mock.Mock(return_value={'database': 'replica'})),
+    )))
+    context = mock.MagicMock()
+    context.return_value.__aenter__.return_value = session
+    repository = UserRepository(context_async_session=context, fast_reads=True)
+
+    user = await repository.get(username='user1', email='e@mail.com')
+    assert await repository.get_many_by('id', [2, 3]) == {}
+
+    assert user.id == 1 and user.password == b"b'hash'"
+    driver.fetchrow.assert_awaited_once_with(
+        'SELECT id, password, username, email, version FROM "user" WHERE email = $1 AND username = $2 LIMIT 1',
+        'e@mail.com', 'user1',
+    )
+    driver.fetch.assert_awaited_once_with(
+        'SELECT id, password, username, email, version FROM "user" WHERE id = ANY($1::INTEGER[])', [2, 3],
+    )
+
+
+def test_schema_bootstrap_is_skipped_at_alembic_head():
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        assert not alembic_head_applied(conn)
+
+        conn.execute(text('CREATE TABLE alembic_version (version_num VARCHAR(32) PRIMARY KEY)'))
+        conn.execute(text("INSERT INTO alembic_version VALUES ('51a7070db33b')"))
+        assert not alembic_head_applied(conn)
+
+        head = ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+        conn.execute(text('UPDATE alembic_version SET version_num = :head'), {'head': head})
+        assert alembic_head_applied(conn)
@@ -1,14 +1,20 @@
 """ Test User API with DB/REDIS mock """
 
+import json
 from unittest import mock
 
 import pytest
 from deepdiff import DeepDiff
+from dependency_injector import providers
 from fastapi import FastAPI
 from httpx import AsyncClient
 
+from internal.app.api.dependencies import principal_claims
+from internal.app.api.pagination import encode_cursor
+from internal.app.settings import GlobalSettings
 from internal.db.repositories.user import UserRepository
-from internal.models.schemas import OutUserSchema
+from internal.models.schemas import OutUserSchema, UserSchema
+from internal.pkg.cache import ExistenceFilter
 
 
 @pytest.mark.asyncio
@@ -32,6 +38,41 @@ async def test_create_user(app: 'FastAPI', client: 'AsyncClient', user_schema_fa
     assert not DeepDiff({"id": user.id, "email": user.email, "username": user.username}, response.json())
 
 
+@pytest.mark.asyncio
+async def test_sign_up_checks_known_names_before_hashing(app: 'FastAPI', client: 'AsyncClient', user_schema_factory):
+    user = user_schema_factory()
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.get.return_value = user
+    repository_mock.create.return_value = None
+
+    async def page(after, limit):
+        return [] if after else [user]
+
+    existence = ExistenceFilter(page, ['username', 'email'])
+    await existence.refresh()
+    auth = mock.Mock(wraps=app.container.auth())
+
+    with app.container.user_repository.override(repository_mock), \
+            app.container.user_filter.override(providers.Object(existence)), \
+            app.container.auth.override(providers.Object(auth)):
+        taken = await client.post(
+            app.url_path_for('auth:register'),
+            json={"email": "new@email.com", "username": user.username, "password": "12312300"},
+        )
+        assert taken.status_code == 400
+        assert repository_mock.get.call_args.kwargs == {'username': user.username}
+        assert not auth.encode_password_async.called
+
+        repository_mock.get.reset_mock()
+        fresh = await client.post(
+            app.url_path_for('auth:register'),
+            json={"email": "new@email.com", "username": "newcomer", "password": "12312300"},
+        )
+        # Neither name was ever seen, straight to the insert
+        assert not repository_mock.get.called
+        assert repository_mock.create.called and fresh.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test_get_user(auth_client, user_schema_factory, app):
     user = user_schema_factory()
@@ -77,6 +118,28 @@ async def test_update_user(auth_client, user_schema_factory, app):
     assert not DeepDiff({"id": update.id, "email": update.email, "username": update.username}, response.json())
 
 
+@pytest.mark.asyncio
+async def test_me_after_update(app: 'FastAPI', client: 'AsyncClient', user_schema_factory):
+    user = user_schema_factory(version=1)
+    updated = user.copy(update={'username': 'renamed', 'version': 2})
+    token = app.container.auth().encode_token(user.id, principal_claims(user))
+    headers = {'Authorization': f'Bearer {token}'}
+
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.get_by_id.return_value = user
+    repository_mock.update_by_id.return_value = updated
+
+    with app.container.user_repository.override(repository_mock):
+        before = await client.get(app.url_path_for('user:me'), headers=headers)
+        patched = await client.patch(app.url_path_for('user:update'), json={'username': 'renamed'}, headers=headers)
+        repository_mock.get_by_id.return_value = updated
+        after = await client.get(app.url_path_for('user:me'), headers=headers)
+
+    assert before.json()['username'] == user.username
+    assert after.json()['username'] == 'renamed'
+    assert after.headers['ETag'] == patched.headers['ETag'] == f'"{user.id}.2"'
+
+
 @pytest.mark.asyncio
 async def test_delete_user(auth_client, user_schema_factory, app):
     user = user_schema_factory()
@@ -89,3 +152,159 @@ async def test_delete_user(auth_client, user_schema_factory, app):
         response = client.delete(app.url_path_for('user:delete'), json={"username": "new"})
 
     assert response.status_code == 204
+
+
+@pytest.mark.asyncio
+async def test_current_user_is_cached(app: 'FastAPI', client: 'AsyncClient', user_schema_factory):
+    user = user_schema_factory()
+    token = app.container.auth().encode_token(user.id)
+
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.get_by_id.return_value = user
+    repository_mock.delete_by_id.return_value = True
+
+    with app.container.user_repository.override(repository_mock):
+        for _ in range(3):
+            response = await client.get(app.url_path_for('user:me'), headers={'Authorization': f'Bearer {token}'})
+            assert response.status_code == 200
+        # Once for the principal, once for the body of /me
+        assert repository_mock.get_by_id.call_count == 2
+
+        response = await client.delete(app.url_path_for('user:delete'), headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 204
+
+        repository_mock.get_by_id.return_value = None
+        response = await client.get(app.url_path_for('user:me'), headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_get_users_batch(auth_client, user_schema_factory, app):
+    users = {_id: user_schema_factory(_id=_id, username=f'user{_id}', email=f'user{_id}@email.com') for _id in (1, 2, 3)}
+    client = auth_client()
+
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.get_by_id.return_value = users[1]
+    repository_mock.get_many.return_value = [users[2], users[3]]
+
+    with app.container.user_repository.override(repository_mock):
+        client.get(app.url_path_for('user:get', _id=1))
+        response = client.get(app.url_path_for('user:batch'), params={'ids': [3, 1, 2, 404]})
+
+    assert response.status_code == 200
+    repository_mock.get_many.assert_called_once_with([3, 2, 404])
+    assert not DeepDiff([OutUserSchema(**users[_id].dict()).dict() for _id in (3, 1, 2)], response.json())
+
+
+@pytest.mark.asyncio
+async def test_list_users(auth_client, user_schema_factory, app):
+    users = [user_schema_factory(_id=_id, username=f'user{_id}', email=f'user{_id}@email.com') for _id in (1, 2, 3)]
+    client = auth_client()
+
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.keyset.return_value = ('username', 'id')
+    repository_mock.list_after.side_effect = [users[:2], users[2:]]
+
+    with app.container.user_repository.override(repository_mock):
+        first = client.get(app.url_path_for('user:list'), params={'limit': 2, 'order_by': 'username'}).json()
+        second = client.get(
+            app.url_path_for('user:list'),
+            params={'limit': 2, 'order_by': 'username', 'cursor': first['next_cursor']},
+        ).json()
+        mismatch = client.get(app.url_path_for('user:list'), params={'limit': 2, 'cursor': first['next_cursor']})
+
+    assert [user['id'] for user in first['items']] == [1, 2]
+    assert [user['id'] for user in second['items']] == [3]
+    assert second['next_cursor'] is None
+    assert repository_mock.list_after.call_args_list[1].args == (['user2', 2], 2, 'username')
+    assert mismatch.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_list_users_rejects_crafted_cursors(auth_client, app):
+    client = auth_client()
+    secret = app.container.settings().SECRET_KEY
+
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.keyset.return_value = ('id',)
+
+    valid = encode_cursor('id', [1], secret)
+    crafted = [
+        encode_cursor('id', ['x'], secret),
+        encode_cursor('id', [True], secret),
+        encode_cursor('id', [1, 2], secret),
+        encode_cursor('id', [1], 'other secret'),
+        valid.split('.')[0],
+        'not a cursor',
+    ]
+    with app.container.user_repository.override(repository_mock):
+        responses = [client.get(app.url_path_for('user:list'), params={'cursor': cursor}) for cursor in crafted]
+
+    assert [response.status_code for response in responses] == [400] * len(crafted)
+    repository_mock.list_after.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_list_users_streams_large_pages(auth_client, user_schema_factory, app):
+    users = [user_schema_factory(_id=_id, username=f'user{_id}', email=f'user{_id}@email.com') for _id in (1, 2)]
+    client = auth_client()
+
+    async def stream_after(cursor, limit, order_by):
+        for user in users:
+            yield user
+
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.keyset.return_value = ('id',)
+    repository_mock.stream_after = stream_after
+
+    with app.container.user_repository.override(repository_mock):
+        response = client.get(app.url_path_for('user:list'), params={'limit': 5000})
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert not DeepDiff([OutUserSchema(**user.dict()).dict() for user in users], lines)
+
+
+@pytest.mark.asyncio
+async def test_import_users(app: 'FastAPI', client: 'AsyncClient', user_schema_factory):
+    users = [
+        {"username": "user1", "email": "user1@email.com", "password": "12312300"},
+        {"username": "user2", "email": "user2@email.com", "password": "12312300"},
+    ]
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.create_many.side_effect = lambda batch: ([UserSchema(id=1, **batch[0].dict())], batch[1:])
+
+    with app.container.user_repository.override(repository_mock), \
+            app.container.settings.override(providers.Object(GlobalSettings(ADMIN_TOKEN='admin'))):
+        forbidden = await client.post(app.url_path_for('admin:users-import'), json=users)
+        response = await client.post(
+            app.url_path_for('admin:users-import'), json=users, headers={'X-Admin-Token': 'admin'},
+        )
+
+    assert forbidden.status_code == 403
+    assert response.status_code == 200
+    assert response.json() == {"created": 1, "rejected": [{"username": "user2", "email": "user2@email.com"}]}
+    imported = repository_mock.create_many.call_args.args[0]
+    assert all(user.password.startswith(b"$2b$") for user in imported)
+
+
+@pytest.mark.asyncio
+async def test_conditional_get(auth_client, user_schema_factory, app):
+    user = user_schema_factory(version=3)
+    client = auth_client(user)
+    repository_mock = mock.Mock(spec=UserRepository)
+    repository_mock.get_by_id.return_value = user
+
+    with app.container.user_repository.override(repository_mock):
+        response = client.get(app.url_path_for('user:get', _id=user.id))
+        etag = response.headers['ETag']
+        cached = client.get(app.url_path_for('user:get', _id=user.id), headers={'If-None-Match': f'"x", W/{etag}'})
+        changed = client.get(app.url_path_for('user:get', _id=user.id), headers={'If-None-Match': '"stale"'})
+        me = client.get(app.url_path_for('user:me'), headers={'If-None-Match': etag})
+
+    assert etag == f'"{user.id}.3"'
+    assert (cached.status_code, cached.content, cached.headers['ETag']) == (304, b'', etag)
+    assert changed.status_code == 200 and changed.json() == response.json()
+    assert me.status_code == 304
+    repository_mock.get_by_id.assert_called_once_with(user.id)